@@ -1,42 +1,115 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from lib.distribute import hierarchy_groups, processors_of
+from lib.map.adjacency import Seam, map_edges
 from lib.map.map import Map
 import numpy as np
 
-def calculate_total_perimeter(grid):
+
+def calculate_perimeters(grid) -> tuple[int, np.ndarray]:
+    """
+    Perimeter of every processor's region in grid: the number of cell sides that face
+    a different processor or the domain boundary, counted with shifted-array
+    comparisons over the whole grid. Processors are non-negative integers.
+    Works for grids of any dimension, for a 3D grid this is the surface area.
+
+    Returns:
+        total perimeter and an array of perimeters indexed by processor
+    """
+    grid = np.asarray(grid)
     if not grid.size:
-        return 0
+        return 0, np.zeros(0, dtype=np.int64)
+
+    sides = np.zeros(grid.shape, dtype=np.int64)
+    for axis in range(grid.ndim):
+        def part(start, stop):
+            index = [slice(None)] * grid.ndim
+            index[axis] = slice(start, stop)
+            return tuple(index)
+        # domain boundary
+        sides[part(0, 1)] += 1
+        sides[part(-1, None)] += 1
+        # faces between different processors count for both of them
+        differ = grid[part(1, None)] != grid[part(None, -1)]
+        sides[part(1, None)] += differ
+        sides[part(None, -1)] += differ
+
+    per_processor = np.bincount(grid.ravel(), weights=sides.ravel()).astype(np.int64)
+    return int(sides.sum()), per_processor
+
+
+def calculate_total_perimeter(grid):
+    return calculate_perimeters(grid)[0]
+
+def get_perimeter_sum(map: Map, ranges: Optional[np.ndarray] = None, proc_mapping: Optional[np.ndarray] = None) -> int:
+    """
+    Sum of the perimeters over the tiles of the map. With ranges, the (N_p, 2) [start, end)
+    curve indices per processor, or with proc_mapping, the processor of every curve
+    index, the perimeters of the partition of every tile are summed.
+    """
+    if ranges is None and proc_mapping is None:
+        return sum(calculate_total_perimeter(tile) for tile in map.tile_curves)
+    return sum(calculate_total_perimeter(processors_of(tile, proc_mapping, ranges)) for tile in map.tile_curves)
+
 
-    total_perimeter = 0
-    rows, cols = grid.shape
-    visited = set()
+def calculate_level_perimeters(grid, topology: list[int]) -> list[int]:
+    """
+    Total perimeter of the groups of every level of a hierarchical partition
+    (see distribute.split_hierarchical): grid holds leaf processors, level 0 counts
+    only the sides between nodes (and the domain boundary), the last level all of them.
+    """
+    groups = hierarchy_groups(topology)
+    return [calculate_total_perimeter(np.take(level, grid)) for level in groups]
 
-    for i in range(rows):
-        for j in range(cols):
-            if (i, j) in visited:
-                continue
 
-            current_num = grid[i, j]
-            queue = [(i, j)]
-            visited.add((i, j))
-            island_perimeter = 0
+@dataclass
+class CommunicationMetrics:
+    edge_cut: int  # neighbouring cell pairs owned by different processors
+    halo_volume: np.ndarray  # per processor: cells of other processors next to its own cells
+    neighbour_ranks: np.ndarray  # per processor: number of distinct processors it exchanges with
 
-            while queue:
-                x, y = queue.pop(0)
 
-                # Check all 4 directions
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
+def get_communication_metrics(map: Map, proc_mapping: Optional[np.ndarray] = None, seams: Iterable[Seam] = (),
+                              ranges: Optional[np.ndarray] = None) -> CommunicationMetrics:
+    """
+    Communication cost of a partition of the whole map. Unlike get_perimeter_sum, edges
+    on the seams between tiles connect to the neighbouring tile (see map_edges), so
+    they only count when the cells on both sides belong to different processors.
 
-                    # If neighbor is out of bounds or different number, it's a perimeter edge
-                    if nx < 0 or nx >= rows or ny < 0 or ny >= cols or grid[nx, ny] != current_num:
-                        island_perimeter += 1
-                    # If neighbor is same number and not visited, add to queue
-                    elif (nx, ny) not in visited:
-                        visited.add((nx, ny))
-                        queue.append((nx, ny))
+    Args:
+        map: the partitioned Map
+        proc_mapping: processor of every curve index
+        seams: extra tile adjacencies, e.g. the remaining edges of a cubed sphere
+        ranges: (N_p, 2) [start, end) curve indices per processor, used instead of
+            proc_mapping, the processors of the edge ends are looked up in them
+    """
+    edges = map_edges(map, seams)
+    a, b = edges[:, 0], edges[:, 1]
+    pa, pb = processors_of(a, proc_mapping, ranges), processors_of(b, proc_mapping, ranges)
+    cut = pa != pb
+    a, b, pa, pb = a[cut], b[cut], pa[cut], pb[cut]
 
-            total_perimeter += island_perimeter
+    n = map.get_total_n()
+    n_p = len(ranges) if ranges is not None else int(np.max(proc_mapping)) + 1
+    ghosts = np.unique(np.concatenate([pa * n + b, pb * n + a]))
+    pairs = np.unique(np.concatenate([pa * n_p + pb, pb * n_p + pa]))
+    return CommunicationMetrics(
+        edge_cut=int(cut.sum()),
+        halo_volume=np.bincount(ghosts // n, minlength=n_p),
+        neighbour_ranks=np.bincount(pairs // n_p, minlength=n_p),
+    )
 
-    return total_perimeter
 
-def get_perimeter_sum(map: Map) -> int:
-    return sum(calculate_total_perimeter(tile) for tile in map.tile_curves)
\ No newline at end of file
+def get_level_edge_cuts(map: Map, proc_mapping: np.ndarray, topology: list[int],
+                        seams: Iterable[Seam] = ()) -> list[int]:
+    """
+    Edge cut of every level of a hierarchical partition of the whole map: the number
+    of neighbouring cell pairs in different nodes (level 0), in different sockets
+    (level 1) and so on down to different leaf processors. proc_mapping holds leaf
+    processors numbered as in distribute.hierarchy_groups.
+    """
+    edges = map_edges(map, seams)
+    procs = np.asarray(proc_mapping)[edges]
+    return [int(np.count_nonzero(level[procs[:, 0]] != level[procs[:, 1]]))
+            for level in hierarchy_groups(topology)]
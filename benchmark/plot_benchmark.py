@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import numpy as np
 
 from lib import distribute, curves
@@ -6,8 +5,8 @@ from benchmark import perimeter_sum
 from benchmark.geometric_algo import geom_partition
 
 
-def pipeline(N, M, N_p):
-    curve, xy_to_index = curves.generate_hilbert_mappings(N, M)
+def pipeline(N, M, N_p, curve_name='gilbert'):
+    curve, xy_to_index = curves.curve_mappings(curve_name, N, M)
     assert(len(curve) == N*M)
 
     proc_map = distribute.split_into_processors(N * M, N_p)
@@ -21,6 +20,8 @@ def geom_pipeline_perimeter_sum(N, M, N_p):
 
 
 def plot_perimeter_sum(N, max_N_p):
+    import matplotlib.pyplot as plt
+
     X = list(range(10, max_N_p))
     Y = [geom_pipeline_perimeter_sum(N, N, n_p) for n_p in X]
     print(max(Y))
@@ -0,0 +1,215 @@
+"""
+Benchmark harness: sweeps grid sizes, tile layouts, processor counts and curve
+backends, times every stage of the pipeline and records peak memory. Results are
+written as JSON, and a previous results file can be passed with --compare to see
+which stages got faster or slower.
+
+    python -m benchmark.run_benchmarks --sizes 256 1024 4096 8192 --procs 16 256 -o results.json
+    python -m benchmark.run_benchmarks --sizes 256 1024 --compare results.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from benchmark.perimeter_sum import get_communication_metrics, get_perimeter_sum
+from lib import curves, distribute
+from lib.profiling import peak_rss_mb
+from lib.map.map import Map, TileDTO, NextConnect
+from lib.map.mapfile import save_map_file
+from lib.misc.export import save_map
+
+STAGES = ['curve', 'map', 'distribute', 'metric', 'export']
+# connections of the unfolded cube in config.example.json
+_CUBE_CONNECTIONS = [NextConnect.RIGHT, NextConnect.TOP] * 3
+# index_to_xy and xy_to_index of a curve, with int64 indices
+_CURVE_BYTES_PER_POINT = 3 * 8
+
+
+@dataclass
+class Case:
+    layout: str  # 'square': one size x size tile, 'cube': six size x size tiles
+    size: int
+    n_p: int
+    curve: str = 'gilbert'
+    export: str = 'binary'  # 'binary' (save_map_file), 'csv', 'npz' (save_map) or 'none'
+    trace: bool = False  # also record allocation peaks with tracemalloc (slows numpy code down)
+
+
+@dataclass
+class Result:
+    case: Case
+    n_points: int = 0
+    # stage -> {'seconds', 'peak_rss_mb', 'rss_growth_mb'[, 'peak_alloc_mb']}. peak_rss_mb is the
+    # process high-water mark at the end of the stage, so it carries over from earlier stages;
+    # rss_growth_mb is how much the stage raised it (0 for stages below an earlier peak)
+    stages: dict = field(default_factory=dict)
+    metrics: dict = field(default_factory=dict)
+    error: str = ''
+
+
+def layout_tiles(layout: str, size: int, curve: str) -> list[TileDTO]:
+    if layout == 'square':
+        return [TileDTO(width=size, height=size, next_conn=NextConnect.RIGHT, curve=curve)]
+    if layout == 'cube':
+        return [TileDTO(width=size, height=size, next_conn=conn, curve=curve) for conn in _CUBE_CONNECTIONS]
+    raise ValueError(f"unknown layout: {layout}")
+
+
+class _Stage:
+    def __init__(self, result: Result, name: str):
+        self.result = result
+        self.name = name
+
+    def __enter__(self):
+        if self.result.case.trace:
+            tracemalloc.reset_peak()
+        self.rss_before = peak_rss_mb()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = peak_rss_mb()
+        record = {'seconds': seconds, 'peak_rss_mb': peak, 'rss_growth_mb': peak - self.rss_before}
+        if self.result.case.trace:
+            record['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        self.result.stages[self.name] = record
+
+
+def run_case(case: Case) -> Result:
+    """Runs every stage of one case in the current process."""
+    result = Result(case)
+    tiles = layout_tiles(case.layout, case.size, case.curve)
+    result.n_points = sum(t.width * t.height for t in tiles)
+    curves.curve_cache.clear()
+    # room for every curve of the case, so the map stage reuses what the curve stage built
+    max_bytes = curves.curve_cache.max_bytes
+    curves.curve_cache.resize(max(max_bytes, _CURVE_BYTES_PER_POINT * result.n_points))
+    if case.trace:
+        tracemalloc.start()
+    try:
+        with _Stage(result, 'curve'):
+            for shape in {(t.height, t.width) for t in tiles}:
+                curves.curve_mappings(case.curve, *shape)
+        with _Stage(result, 'map'):
+            tile_map = Map(tiles)
+        with _Stage(result, 'distribute'):
+            ranges = distribute.split_into_ranges(result.n_points, case.n_p)
+            proc_mapping = distribute.ranges_to_mapping(ranges)
+        with _Stage(result, 'metric'):
+            metrics = get_communication_metrics(tile_map, proc_mapping)
+            result.metrics = {
+                'edge_cut': metrics.edge_cut,
+                'max_halo_volume': int(metrics.halo_volume.max()),
+                'max_neighbour_ranks': int(metrics.neighbour_ranks.max()),
+                'perimeter_sum': get_perimeter_sum(tile_map, ranges),
+                'imbalance': distribute.imbalance(ranges),
+            }
+        with tempfile.TemporaryDirectory() as tmp, _Stage(result, 'export'):
+            if case.export == 'binary':
+                save_map_file(tile_map, Path(tmp) / 'map.sfc', proc_mapping)
+            elif case.export in ('csv', 'npz'):
+                save_map(tile_map, str(Path(tmp) / 'mapping'), proc_mapping, compressed=case.export == 'npz')
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        curves.curve_cache.resize(max_bytes)
+        if case.trace:
+            tracemalloc.stop()
+    return result
+
+
+def run_isolated(case: Case) -> Result:
+    """
+    Runs the case in a fresh process, so that peak_rss_mb belongs to this case only
+    and no caches are shared between cases.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(run_case, case).result()
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def _key(result: dict) -> tuple:
+    case = result['case']
+    return case['layout'], case['size'], case['n_p'], case['curve']
+
+
+def compare(results: list[dict], baseline: list[dict]) -> list[str]:
+    """Lines with the time ratio (new / baseline) of every stage of the cases found in both."""
+    old = {_key(r): r for r in baseline}
+    lines = []
+    for result in results:
+        if _key(result) not in old or result['error']:
+            continue
+        before = old[_key(result)]['stages']
+        ratios = [f"{stage} x{result['stages'][stage]['seconds'] / before[stage]['seconds']:.2f}"
+                  for stage in STAGES if stage in result['stages'] and before.get(stage, {}).get('seconds')]
+        lines.append(f"{'/'.join(map(str, _key(result)))}: " + ', '.join(ratios))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 1024, 4096, 8192], help='tile sides')
+    parser.add_argument('--layouts', nargs='+', default=['square', 'cube'], choices=['square', 'cube'])
+    parser.add_argument('--procs', type=int, nargs='+', default=[16, 256], help='numbers of processors')
+    parser.add_argument('--curves', nargs='+', default=['gilbert'], choices=sorted(curves.CURVES))
+    parser.add_argument('--export', default='binary', choices=['binary', 'csv', 'npz', 'none'])
+    parser.add_argument('--trace', action='store_true', help='record allocation peaks with tracemalloc')
+    parser.add_argument('--in-process', action='store_true', help="don't start a fresh process per case")
+    parser.add_argument('-o', '--output', help='write the results as JSON into this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare the timings with')
+    args = parser.parse_args(argv)
+
+    results = []
+    for layout, size, n_p, curve in itertools.product(args.layouts, args.sizes, args.procs, args.curves):
+        case = Case(layout, size, n_p, curve, args.export, args.trace)
+        result = asdict(run_case(case) if args.in_process else run_isolated(case))
+        results.append(result)
+        if result['error']:
+            print(f"{layout} {size} N_p={n_p} {curve}: {result['error']}")
+        else:
+            timings = ' '.join(f"{s}={r['seconds']:.3f}s" for s, r in result['stages'].items())
+            peak = max(r['peak_rss_mb'] for r in result['stages'].values())
+            print(f"{layout} {size} N_p={n_p} {curve}: {timings} peak={peak:.0f}MB")
+
+    report = {'environment': _environment(), 'results': results}
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print('\n'.join(compare(results, baseline)))
+    return report
+
+
+if __name__ == '__main__':
+    main()
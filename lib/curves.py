@@ -1,7 +1,13 @@
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
 from functools import lru_cache
+from typing import Callable, Optional
 
 import numpy as np
 
+from lib import profiling
+
 
 def gilbert2d(width, height):
     """
@@ -9,14 +15,13 @@ def gilbert2d(width, height):
     2D rectangular grids. Returns a list of discrete 2D coordinates to fill a rectangle
     of size (width x height).
     """
-    return generate2d(0, 0, 0, height, width, 0)
+    return [tuple(p) for p in gilbert2d_array(width, height).tolist()]
 
 
 def sgn(x):
     return -1 if x < 0 else (1 if x > 0 else 0)
 
 
-@lru_cache(maxsize=None)
 def generate2d(x, y, ax, ay, bx, by):
     w = abs(ax + ay)
     h = abs(bx + by)
@@ -61,15 +66,216 @@ def generate2d(x, y, ax, ay, bx, by):
                            -bx2, -by2, -(ax - ax2), -(ay - ay2))
         return part1 + part2 + part3
 
-def generate_hilbert_mappings(N, M):
+
+# upper bound on the number of pending sub-rectangles processed in one batch,
+# keeps the working set of gilbert2d_array bounded for very large grids
+_BATCH_SIZE = 1 << 16
+# sub-rectangles with both sides up to this size are filled from a template
+_TEMPLATE_SIDE = 16
+
+
+@lru_cache(maxsize=4 * _TEMPLATE_SIDE ** 2)
+def _template(w, h, sa, sb):
+    """
+    Points of generate2d for a w x h sub-rectangle in its own frame: (i, j) are steps
+    along the major and orthogonal directions. The traversal depends only on the sizes
+    and on the signs of the directions (through floor division), so one template
+    serves every sub-rectangle with the same (w, h, sa, sb).
+    """
+    points = np.array(generate2d(0, 0, sa * w, 0, 0, sb * h), dtype=np.int64)
+    return points[:, 0] * sa, points[:, 1] * sb
+
+
+def _fill_runs(out, offsets, x, y, dx, dy, lengths):
+    """Writes straight runs of points (the trivial row/column fills) into out."""
+    if not len(lengths):
+        return
+    starts = np.cumsum(lengths) - lengths
+    run = np.repeat(np.arange(len(lengths)), lengths)
+    step = np.arange(starts[-1] + lengths[-1]) - starts[run]
+    pos = offsets[run] + step
+    out[pos, 0] = x[run] + step * dx[run]
+    out[pos, 1] = y[run] + step * dy[run]
+
+
+def _fill_templates(out, offsets, x, y, dax, day, dbx, dby, w, h):
+    """Writes small sub-rectangles by applying their cached templates."""
+    keys = ((w * (_TEMPLATE_SIDE + 1) + h) * 2 + (dax + day > 0)) * 2 + (dbx + dby > 0)
+    for key in np.unique(keys):
+        sel = keys == key
+        k = np.flatnonzero(sel)[0]
+        i, j = _template(int(w[k]), int(h[k]), int(dax[k] + day[k]), int(dbx[k] + dby[k]))
+        pos = offsets[sel, None] + np.arange(len(i))
+        out[pos, 0] = x[sel, None] + i * dax[sel, None] + j * dbx[sel, None]
+        out[pos, 1] = y[sel, None] + i * day[sel, None] + j * dby[sel, None]
+
+
+@profiling.profiled('curves.gilbert2d_array', cells=lambda width, height: width * height)
+def gilbert2d_array(width, height) -> np.ndarray:
+    """
+    Non-recursive NumPy version of gilbert2d. Returns a (width*height, 2) int32 array
+    with exactly the same ordering as gilbert2d(width, height).
+
+    Pending generate2d calls are kept as rows of an array together with the position
+    of their first point in the output, so that whole batches of sub-rectangles are
+    split (or filled) at once and every point is written only once.
+    """
+    if width <= 0 or height <= 0:
+        raise ValueError(f"grid sides must be positive, got {width}x{height}")
+    out = np.empty((width * height, 2), dtype=np.int32)
+
+    # each row is (x, y, ax, ay, bx, by) of a pending generate2d call
+    stack = [(np.array([[0, 0, 0, height, width, 0]], dtype=np.int64), np.zeros(1, dtype=np.int64))]
+    while stack:
+        frames, offsets = stack.pop()
+        x, y, ax, ay, bx, by = frames.T
+        w = np.abs(ax + ay)
+        h = np.abs(bx + by)
+        dax, day = np.sign(ax), np.sign(ay)  # unit major direction
+        dbx, dby = np.sign(bx), np.sign(by)  # unit orthogonal direction
+
+        # trivial row fill
+        row = h == 1
+        _fill_runs(out, offsets[row], x[row], y[row], dax[row], day[row], w[row])
+        # trivial column fill
+        col = (w == 1) & ~row
+        _fill_runs(out, offsets[col], x[col], y[col], dbx[col], dby[col], h[col])
+
+        small = ~(row | col) & (w <= _TEMPLATE_SIDE) & (h <= _TEMPLATE_SIDE)
+        _fill_templates(out, offsets[small], x[small], y[small], dax[small], day[small],
+                        dbx[small], dby[small], w[small], h[small])
+
+        rest = ~(row | col | small)
+        if not rest.any():
+            continue
+        x, y, ax, ay, bx, by, w, h, dax, day, dbx, dby, offsets = (
+            a[rest] for a in (x, y, ax, ay, bx, by, w, h, dax, day, dbx, dby, offsets))
+
+        ax2, ay2 = ax // 2, ay // 2
+        bx2, by2 = bx // 2, by // 2
+        w2 = np.abs(ax2 + ay2)
+        h2 = np.abs(bx2 + by2)
+
+        children = []
+
+        # long case: split in two parts only
+        l = 2 * w > 3 * h
+        even = (w2[l] % 2 == 1) & (w[l] > 2)  # prefer even steps
+        lax2 = ax2[l] + even * dax[l]
+        lay2 = ay2[l] + even * day[l]
+        size1 = np.abs(lax2 + lay2) * h[l]
+        children.append((np.stack([x[l], y[l], lax2, lay2, bx[l], by[l]], axis=1), offsets[l]))
+        children.append((np.stack([x[l] + lax2, y[l] + lay2, ax[l] - lax2, ay[l] - lay2, bx[l], by[l]], axis=1),
+                         offsets[l] + size1))
+
+        # standard case: one step up, one long horizontal, one step down
+        s = ~l
+        even = (h2[s] % 2 == 1) & (h[s] > 2)  # prefer even steps
+        sbx2 = bx2[s] + even * dbx[s]
+        sby2 = by2[s] + even * dby[s]
+        size1 = np.abs(sbx2 + sby2) * np.abs(ax2[s] + ay2[s])
+        size2 = w[s] * np.abs(bx[s] - sbx2 + by[s] - sby2)
+        children.append((np.stack([x[s], y[s], sbx2, sby2, ax2[s], ay2[s]], axis=1), offsets[s]))
+        children.append((np.stack([x[s] + sbx2, y[s] + sby2, ax[s], ay[s], bx[s] - sbx2, by[s] - sby2], axis=1),
+                         offsets[s] + size1))
+        children.append((np.stack([x[s] + (ax[s] - dax[s]) + (sbx2 - dbx[s]), y[s] + (ay[s] - day[s]) + (sby2 - dby[s]),
+                                   -sbx2, -sby2, -(ax[s] - ax2[s]), -(ay[s] - ay2[s])], axis=1),
+                         offsets[s] + size1 + size2))
+
+        frames = np.concatenate([c[0] for c in children])
+        offsets = np.concatenate([c[1] for c in children])
+        for start in range(0, len(frames), _BATCH_SIZE):
+            stack.append((frames[start:start + _BATCH_SIZE], offsets[start:start + _BATCH_SIZE]))
+
+    return out
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'entries', 'nbytes', 'max_bytes'])
+
+
+class CurveCache:
+    """
+    LRU cache of read-only curve arrays keyed on the requested grid size.
+    The total size of the cached arrays is kept under max_bytes; values that don't
+    fit into the budget at all are returned without being cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Returns the cached tuple of arrays for key, building it with factory() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                profiling.count('curves.cache_hits')
+                return self._entries[key]
+            self._misses += 1
+        profiling.count('curves.cache_misses')
+
+        with profiling.stage('curves.build') as stage:
+            value = tuple(factory())
+            stage.add_cells(len(value[0]))
+        for a in value:
+            a.flags.writeable = False
+        nbytes = sum(a.nbytes for a in value)
+
+        with self._lock:
+            if key not in self._entries and nbytes <= self.max_bytes:
+                self._entries[key] = value
+                self._nbytes += nbytes
+                self._evict(self.max_bytes)
+        return value
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict(max_bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def discard(self, predicate: Callable[[object], bool]):
+        """Drops the entries whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._nbytes -= sum(a.nbytes for a in self._entries.pop(key))
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, len(self._entries),
+                             self._nbytes, self.max_bytes)
+
+    def _evict(self, max_bytes: int):
+        while self._nbytes > max_bytes:
+            _, value = self._entries.popitem(last=False)
+            self._nbytes -= sum(a.nbytes for a in value)
+            self._evictions += 1
+
+
+# shared by everything that asks for hilbert mappings of a given size
+curve_cache = CurveCache(max_bytes=256 * 2**20)
+
+
+def _index_dtype(total_points: int):
+    return np.int32 if total_points <= np.iinfo(np.int32).max else np.int64
+
+
+def _build_hilbert_mappings(N, M):
     total_points = N * M
-    index_to_xy = np.array([(0, 0)] * total_points, dtype=int)
-    xy_to_index = np.zeros((N, M), dtype=int)
-    i = 0
-    for (x, y) in gilbert2d(N, M):
-        xy_to_index[x, y] = i
-        index_to_xy[i] = (x, y)
-        i += 1
+    dtype = _index_dtype(total_points)
+    index_to_xy = gilbert2d_array(N, M)
+    xy_to_index = np.empty((N, M), dtype=dtype)
+    xy_to_index[index_to_xy[:, 0], index_to_xy[:, 1]] = np.arange(total_points, dtype=dtype)
 
     last = index_to_xy[-1]
     closest = (0, 0)
@@ -85,3 +291,403 @@ def generate_hilbert_mappings(N, M):
     xy_to_index[last[0]][last[1]] = ind
 
     return index_to_xy, xy_to_index
+
+
+def hilbert_mappings(N, M) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Same as generate_hilbert_mappings, but returns shared read-only arrays (int32
+    while the indices fit) from curve_cache instead of fresh copies.
+    """
+    return curve_cache.get((N, M), lambda: _build_hilbert_mappings(N, M))
+
+
+def gilbert2d_end(width, height) -> tuple[int, int]:
+    """Last point of gilbert2d(width, height), found by following only the last part of every split."""
+    x, y, ax, ay, bx, by = 0, 0, 0, height, width, 0
+    while True:
+        w = abs(ax + ay)
+        h = abs(bx + by)
+        (dax, day) = (sgn(ax), sgn(ay))
+        (dbx, dby) = (sgn(bx), sgn(by))
+        if h == 1:
+            return x + (w - 1) * dax, y + (w - 1) * day
+        if w == 1:
+            return x + (h - 1) * dbx, y + (h - 1) * dby
+
+        ax2, ay2 = ax // 2, ay // 2
+        bx2, by2 = bx // 2, by // 2
+        w2 = abs(ax2 + ay2)
+        h2 = abs(bx2 + by2)
+        if 2 * w > 3 * h:
+            if (w2 % 2) and (w > 2):
+                ax2 += dax
+                ay2 += day
+            x, y, ax, ay = x + ax2, y + ay2, ax - ax2, ay - ay2
+        else:
+            if (h2 % 2) and (h > 2):
+                bx2 += dbx
+                by2 += dby
+            x, y, ax, ay, bx, by = (x + (ax - dax) + (bx2 - dbx), y + (ay - day) + (by2 - dby),
+                                    -bx2, -by2, -(ax - ax2), -(ay - ay2))
+
+
+def hilbert_endpoints(N, M) -> tuple[tuple[int, int], tuple[int, int]]:
+    """
+    Positions of the first and the last point of the hilbert_mappings(N, M) curve
+    (after the corner swap), in O(log(N*M)) without generating the curve.
+    """
+    last = gilbert2d_end(N, M)
+    closest = (0, 0)
+    for corner in ((0, M-1), (N-1, M-1), (N-1, 0)):
+        if abs(corner[0] - last[0]) + abs(corner[1] - last[1]) < abs(closest[0] - last[0]) + abs(closest[1] - last[1]):
+            closest = corner
+    # the swap moves the first point away only when the end is closest to the start corner
+    first = last if closest == (0, 0) and N * M > 1 else (0, 0)
+    return first, closest
+
+
+def generate_hilbert_mappings(N, M):
+    index_to_xy, xy_to_index = hilbert_mappings(N, M)
+    return index_to_xy.astype(int), xy_to_index.astype(int)
+
+
+def _check_power_of_two(n: int):
+    if n <= 0 or n & (n - 1):
+        raise ValueError(f"grid side must be a power of two, got {n}")
+
+
+def d_to_xy(ds, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Coordinates of curve indices ds on an n x n grid (n = 2^k), equal to
+    hilbert_mappings(n, n)[0][ds] but computed bit by bit without building the grid.
+    On such grids gilbert2d is the classic Hilbert curve with x and y swapped.
+    """
+    _check_power_of_two(n)
+    t = np.array(ds, dtype=np.int64)
+    if np.any((t < 0) | (t >= n * n)):
+        raise ValueError(f"curve indices must be in [0, {n * n})")
+    x = np.zeros_like(t)
+    y = np.zeros_like(t)
+    s = 1
+    while s < n:
+        rx = 1 & (t // 2)
+        ry = 1 & (t ^ rx)
+        # rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        x, y = np.where(ry == 0, y, x), np.where(ry == 0, x, y)
+        x += s * rx
+        y += s * ry
+        t //= 4
+        s *= 2
+    return y, x
+
+
+def xy_to_d(xs, ys, n: int) -> np.ndarray:
+    """
+    Curve indices of cells (xs, ys) on an n x n grid (n = 2^k), equal to
+    hilbert_mappings(n, n)[1][xs, ys] but computed without building the grid.
+    """
+    _check_power_of_two(n)
+    # classic Hilbert coordinates are gilbert's swapped
+    x = np.array(ys, dtype=np.int64)
+    y = np.array(xs, dtype=np.int64)
+    if np.any((x < 0) | (x >= n) | (y < 0) | (y >= n)):
+        raise ValueError(f"coordinates must be in [0, {n})")
+    d = np.zeros(np.broadcast(x, y).shape, dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s //= 2
+    return d
+
+
+def gilbert3d(width, height, depth):
+    """
+    Generalized Hilbert ('gilbert') space-filling curve for arbitrary-sized
+    3D boxes. Returns a list of discrete 3D coordinates to fill a box
+    of size (width x height x depth).
+    """
+    return [tuple(p) for p in gilbert3d_array(width, height, depth).tolist()]
+
+
+def _box_sizes(frames):
+    """Number of points in every (origin, a, b, c) frame."""
+    return np.prod(np.abs(frames[:, 1:].sum(axis=2)), axis=1)
+
+
+def _fill_lines(out, offsets, start, step, lengths):
+    """Writes straight runs of points of any dimension into out."""
+    if not len(lengths):
+        return
+    starts = np.cumsum(lengths) - lengths
+    run = np.repeat(np.arange(len(lengths)), lengths)
+    steps = np.arange(starts[-1] + lengths[-1]) - starts[run]
+    out[offsets[run] + steps] = start[run] + steps[:, None] * step[run]
+
+
+@profiling.profiled('curves.gilbert3d_array', cells=lambda width, height, depth: width * height * depth)
+def gilbert3d_array(width, height, depth) -> np.ndarray:
+    """
+    Non-recursive NumPy version of gilbert3d, built like gilbert2d_array. Returns a
+    (width*height*depth, 3) int32 array of (x, y, z) points.
+
+    Pending calls of the recursive 3D generator are (origin, a, b, c) frames, where
+    a is the major direction and b, c the orthogonal ones. A box is split in two
+    along a when it is wide, in three when it is flat in c or in b and in five
+    otherwise, which keeps consecutive points adjacent.
+    """
+    if width <= 0 or height <= 0 or depth <= 0:
+        raise ValueError(f"box sides must be positive, got {width}x{height}x{depth}")
+    out = np.empty((width * height * depth, 3), dtype=np.int32)
+
+    # start along the longest side
+    x, y, z = np.eye(3, dtype=np.int64) * [[width], [height], [depth]]
+    if width >= height and width >= depth:
+        first = [0 * x, x, y, z]
+    elif height >= width and height >= depth:
+        first = [0 * x, y, x, z]
+    else:
+        first = [0 * x, z, x, y]
+    stack = [(np.array([first]), np.zeros(1, dtype=np.int64))]
+    while stack:
+        frames, offsets = stack.pop()
+        p, a, b, c = frames[:, 0], frames[:, 1], frames[:, 2], frames[:, 3]
+        w, h, d = (np.abs(v.sum(axis=1)) for v in (a, b, c))
+        da, db, dc = np.sign(a), np.sign(b), np.sign(c)
+
+        # trivial row/column fills
+        along_a = (h == 1) & (d == 1)
+        along_b = (w == 1) & (d == 1) & ~along_a
+        along_c = (w == 1) & (h == 1) & ~along_a
+        _fill_lines(out, offsets[along_a], p[along_a], da[along_a], w[along_a])
+        _fill_lines(out, offsets[along_b], p[along_b], db[along_b], h[along_b])
+        _fill_lines(out, offsets[along_c], p[along_c], dc[along_c], d[along_c])
+
+        rest = ~(along_a | along_b | along_c)
+        if not rest.any():
+            continue
+        p, a, b, c, w, h, d, da, db, dc, offsets = (
+            v[rest] for v in (p, a, b, c, w, h, d, da, db, dc, offsets))
+
+        # halves, preferring even steps
+        a2, b2, c2 = a // 2, b // 2, c // 2
+        for half, size, unit in ((a2, w, da), (b2, h, db), (c2, d, dc)):
+            half += unit * ((np.abs(half.sum(axis=1)) % 2 == 1) & (size > 2))[:, None]
+
+        wide = (2 * w > 3 * h) & (2 * w > 3 * d)
+        flat_c = ~wide & (3 * h > 4 * d)  # do not split in d
+        flat_b = ~wide & ~flat_c & (3 * d > 4 * h)  # do not split in h
+        regular = ~(wide | flat_c | flat_b)
+
+        cases = []
+        m = wide
+        cases.append([
+            [p[m], a2[m], b[m], c[m]],
+            [p[m] + a2[m], a[m] - a2[m], b[m], c[m]],
+        ])
+        m = flat_c
+        cases.append([
+            [p[m], b2[m], c[m], a2[m]],
+            [p[m] + b2[m], a[m], b[m] - b2[m], c[m]],
+            [p[m] + (a[m] - da[m]) + (b2[m] - db[m]), -b2[m], c[m], -(a[m] - a2[m])],
+        ])
+        m = flat_b
+        cases.append([
+            [p[m], c2[m], a2[m], b[m]],
+            [p[m] + c2[m], a[m], b[m], c[m] - c2[m]],
+            [p[m] + (a[m] - da[m]) + (c2[m] - dc[m]), -c2[m], -(a[m] - a2[m]), b[m]],
+        ])
+        m = regular
+        cases.append([
+            [p[m], b2[m], c2[m], a2[m]],
+            [p[m] + b2[m], c[m], a2[m], b[m] - b2[m]],
+            [p[m] + (b2[m] - db[m]) + (c[m] - dc[m]), a[m], -b2[m], -(c[m] - c2[m])],
+            [p[m] + (a[m] - da[m]) + b2[m] + (c[m] - dc[m]), -c[m], -(a[m] - a2[m]), b[m] - b2[m]],
+            [p[m] + (a[m] - da[m]) + (b2[m] - db[m]), -b2[m], c2[m], -(a[m] - a2[m])],
+        ])
+
+        children = []
+        for m, parts in zip((wide, flat_c, flat_b, regular), cases):
+            offset = offsets[m]
+            for part in parts:
+                part = np.stack(part, axis=1)
+                children.append((part, offset))
+                offset = offset + _box_sizes(part)
+
+        frames = np.concatenate([c[0] for c in children])
+        offsets = np.concatenate([c[1] for c in children])
+        for start in range(0, len(frames), _BATCH_SIZE):
+            stack.append((frames[start:start + _BATCH_SIZE], offsets[start:start + _BATCH_SIZE]))
+
+    return out
+
+
+def _build_hilbert_mappings3d(N, M, K):
+    total_points = N * M * K
+    dtype = _index_dtype(total_points)
+    index_to_xyz = gilbert3d_array(N, M, K)
+    xyz_to_index = np.empty((N, M, K), dtype=dtype)
+    xyz_to_index[index_to_xyz[:, 0], index_to_xyz[:, 1], index_to_xyz[:, 2]] = np.arange(total_points, dtype=dtype)
+    return index_to_xyz, xyz_to_index
+
+
+def hilbert_mappings3d(N, M, K) -> tuple[np.ndarray, np.ndarray]:
+    """3D counterpart of hilbert_mappings: shared read-only (index->xyz, xyz->index) arrays."""
+    return curve_cache.get((N, M, K), lambda: _build_hilbert_mappings3d(N, M, K))
+
+
+def generate_hilbert_mappings3d(N, M, K):
+    index_to_xyz, xyz_to_index = hilbert_mappings3d(N, M, K)
+    return index_to_xyz.astype(int), xyz_to_index.astype(int)
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Moves bit i of every (up to 32-bit) value to bit 2i."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def morton_keys(xs, ys) -> np.ndarray:
+    """Z-order keys of the points, the bits of xs and ys interleaved (xs in the odd bits)."""
+    return (_spread_bits(np.asarray(xs)) << np.uint64(1)) | _spread_bits(np.asarray(ys))
+
+
+def _inverse_mapping(index_to_xy: np.ndarray, N: int, M: int) -> np.ndarray:
+    dtype = _index_dtype(N * M)
+    xy_to_index = np.empty((N, M), dtype=dtype)
+    xy_to_index[index_to_xy[:, 0], index_to_xy[:, 1]] = np.arange(N * M, dtype=dtype)
+    return xy_to_index
+
+
+def _build_morton_mappings(N, M):
+    """Z-order curve; on grids that aren't 2^k sided it skips the keys outside of the grid."""
+    keys = morton_keys(np.arange(N)[:, None], np.arange(M)[None, :])
+    dtype = _index_dtype(N * M)
+    if keys[-1, -1] == N * M - 1:
+        # the keys are exactly 0..N*M-1, no sorting needed
+        xy_to_index = keys.astype(dtype)
+        index_to_xy = np.empty((N * M, 2), dtype=np.int32)
+        index_to_xy[xy_to_index.ravel()] = np.stack(np.divmod(np.arange(N * M), M), axis=1)
+        return index_to_xy, xy_to_index
+    index_to_xy = np.stack(np.divmod(np.argsort(keys, axis=None), M), axis=1).astype(np.int32)
+    return index_to_xy, _inverse_mapping(index_to_xy, N, M)
+
+
+def _check_power_of_three(n: int):
+    k = 1
+    while k < n:
+        k *= 3
+    if n <= 0 or k != n:
+        raise ValueError(f"peano curve needs a square grid with a side of 3^k, got side {n}")
+
+
+def _build_peano_mappings(N, M):
+    """Peano curve of a 3^k x 3^k grid: 3x3 blocks in serpentine order, reflected to stay connected."""
+    if N != M:
+        raise ValueError(f"peano curve needs a square grid with a side of 3^k, got {N}x{M}")
+    _check_power_of_three(N)
+    index_to_xy = np.zeros((1, 2), dtype=np.int32)
+    side = 1
+    while side < N:
+        blocks = []
+        for bx in range(3):
+            for by in (range(3) if bx % 2 == 0 else range(2, -1, -1)):
+                x, y = index_to_xy[:, 0], index_to_xy[:, 1]
+                if by % 2:
+                    x = side - 1 - x
+                if bx % 2:
+                    y = side - 1 - y
+                blocks.append(np.stack([x + bx * side, y + by * side], axis=1))
+        index_to_xy = np.concatenate(blocks)
+        side *= 3
+    return index_to_xy, _inverse_mapping(index_to_xy, N, M)
+
+
+def _build_snake_mappings(N, M):
+    """Row by row along the second axis, every other row reversed."""
+    xs, ys = np.divmod(np.arange(N * M), M)
+    ys = np.where(xs % 2 == 1, M - 1 - ys, ys)
+    index_to_xy = np.stack([xs, ys], axis=1).astype(np.int32)
+    return index_to_xy, _inverse_mapping(index_to_xy, N, M)
+
+
+@dataclass(frozen=True)
+class CurveBackend:
+    """
+    A space-filling curve for N x M grids. build(N, M) returns (index_to_xy, xy_to_index)
+    like generate_hilbert_mappings; endpoints(N, M) returns the positions of its first
+    and last point, so tiles can be oriented without generating the curve.
+    """
+    build: Callable[[int, int], tuple[np.ndarray, np.ndarray]]
+    endpoints: Callable[[int, int], tuple[tuple[int, int], tuple[int, int]]]
+
+
+CURVES: dict[str, CurveBackend] = {}
+
+
+def register_curve(name: str, build: Callable[[int, int], tuple[np.ndarray, np.ndarray]],
+                   endpoints: Optional[Callable] = None):
+    """
+    Adds a curve backend, or replaces the one registered under name (dropping its
+    cached curves). Without endpoints they are read from the generated curve.
+    """
+    if endpoints is None:
+        def endpoints(N, M):
+            index_to_xy = curve_mappings(name, N, M)[0]
+            return tuple(index_to_xy[0].tolist()), tuple(index_to_xy[-1].tolist())
+    if name in CURVES:
+        # the built-in gilbert curve is cached under (N, M), see _cache_key
+        curve_cache.discard(lambda key: key[0] == name or (name == 'gilbert' and len(key) == 2))
+    CURVES[name] = CurveBackend(build, endpoints)
+
+
+def _get_backend(name: str) -> CurveBackend:
+    if name not in CURVES:
+        raise ValueError(f"unknown curve '{name}', expected one of {sorted(CURVES)}")
+    return CURVES[name]
+
+
+def _cache_key(name: str, backend: CurveBackend, N, M) -> tuple:
+    # the built-in gilbert backend shares its entries with hilbert_mappings
+    return (N, M) if backend.build is _build_hilbert_mappings else (name, N, M)
+
+
+def curve_mappings(name: str, N, M) -> tuple[np.ndarray, np.ndarray]:
+    """hilbert_mappings for any registered curve: shared read-only (index_to_xy, xy_to_index)."""
+    backend = _get_backend(name)
+    return curve_cache.get(_cache_key(name, backend, N, M), lambda: backend.build(N, M))
+
+
+def curve_endpoints(name: str, N, M) -> tuple[tuple[int, int], tuple[int, int]]:
+    """Positions of the first and the last point of curve_mappings(name, N, M)."""
+    return _get_backend(name).endpoints(N, M)
+
+
+def _snake_endpoints(N, M):
+    return (0, 0), (N - 1, M - 1 if N % 2 else 0)
+
+
+def _peano_endpoints(N, M):
+    if N != M:
+        raise ValueError(f"peano curve needs a square grid with a side of 3^k, got {N}x{M}")
+    _check_power_of_three(N)
+    return (0, 0), (N - 1, M - 1)
+
+
+register_curve('gilbert', _build_hilbert_mappings, hilbert_endpoints)
+# z-order keys grow with both coordinates, so the curve always ends in the opposite corner
+register_curve('morton', _build_morton_mappings, lambda N, M: ((0, 0), (N - 1, M - 1)))
+register_curve('peano', _build_peano_mappings, _peano_endpoints)
+register_curve('snake', _build_snake_mappings, _snake_endpoints)
@@ -1,15 +1,504 @@
 import numpy as np
 
+from lib import profiling
 
+
+def split_into_ranges(N: int, N_p: int) -> np.ndarray:
+    """
+    Splits curve indices [0, N) into N_p contiguous chunks and returns them as an
+    (N_p, 2) array of [start, end) per processor. The remainder N % N_p is spread
+    over the first processors, one extra point each.
+    """
+    if N_p <= 0:
+        raise Exception('N_p must be non-zero')
+    counts = np.full(N_p, N // N_p, dtype=np.int64)
+    counts[:N % N_p] += 1
+    return _bounds_to_ranges(np.concatenate([[0], np.cumsum(counts)]))
+
+
+def _bounds_to_ranges(bounds: np.ndarray) -> np.ndarray:
+    return np.stack([bounds[:-1], bounds[1:]], axis=1)
+
+
+def weights_in_curve_order(tile_curves: list[np.ndarray], tile_weights: list[np.ndarray]) -> np.ndarray:
+    """Gathers per-tile weight grids, aligned with Map.tile_curves, into one array in curve order."""
+    weights = np.empty(sum(np.size(curve) for curve in tile_curves), dtype=float)
+    for curve, tile_weight in zip(tile_curves, tile_weights):
+        if np.shape(tile_weight) != np.shape(curve):
+            raise ValueError(f"tile weights of shape {np.shape(tile_weight)} don't match tile of shape {np.shape(curve)}")
+        weights[np.ravel(curve)] = np.ravel(tile_weight)
+    return weights
+
+
+def _prefix_sums(weights) -> np.ndarray:
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim != 1:
+        raise ValueError("weights must be given in curve order, see weights_in_curve_order")
+    if np.any(weights < 0):
+        raise ValueError("weights must be non-negative")
+    return np.concatenate([[0.0], np.cumsum(weights)])
+
+
+def _probe(prefix: np.ndarray, N_p: int, bottleneck: float) -> np.ndarray:
+    """
+    Greedy probe of chains-on-chains partitioning: every processor in turn takes the
+    longest chunk with load not above bottleneck. Returns the N_p + 1 bounds reached;
+    the probe succeeded if the last one is the end of the curve.
+    """
+    bounds = np.full(N_p + 1, len(prefix) - 1, dtype=np.int64)
+    bounds[0] = 0
+    for p in range(N_p):
+        bounds[p + 1] = np.searchsorted(prefix, prefix[bounds[p]] + bottleneck, side='right') - 1
+        if bounds[p + 1] == len(prefix) - 1:
+            break
+    return bounds
+
+
+def _optimal_bounds(prefix: np.ndarray, N_p: int, initial: np.ndarray) -> np.ndarray:
+    """
+    Exact bisection for the minimal bottleneck (maximum processor load): both bounds
+    of the search are always loads of real chunks, so the search ends on the
+    optimum instead of converging to it. initial is any feasible partition.
+    """
+    n = len(prefix) - 1
+    best = initial
+    upper = np.max(np.diff(prefix[best]))
+    lower = max(prefix[-1] / N_p, np.max(np.diff(prefix)))
+    # the bounds only move to realizable loads, the cap just guards against rounding
+    for _ in range(256):
+        if lower >= upper:
+            break
+        bounds = _probe(prefix, N_p, (lower + upper) / 2)
+        if bounds[-1] == n:
+            best = bounds
+            upper = np.max(np.diff(prefix[bounds]))
+        else:
+            # no bottleneck below the smallest load that lets some processor take one more point works either
+            extended = np.minimum(bounds[1:] + 1, n)
+            lower = np.min(prefix[extended] - prefix[bounds[:-1]])
+    return best
+
+
+@profiling.profiled('distribute.split_weighted', cells=lambda weights, *args, **kwargs: len(weights))
+def split_weighted(weights, N_p: int, method: str = 'prefix') -> np.ndarray:
+    """
+    Splits the curve into N_p contiguous chunks of near-equal total weight, weights
+    being the cost of every point in curve order. Returns (N_p, 2) ranges like
+    split_into_ranges.
+
+    method='prefix' places each cut on the point boundary closest to its ideal
+    k/N_p share of the total weight, found by binary search over the prefix sums.
+    method='optimal' solves the chains-on-chains problem exactly: it minimizes the
+    maximum processor load, which matters when the weights are spiky.
+    """
+    return _split_prefix(_prefix_sums(weights), N_p, method)
+
+
+def _split_prefix(prefix: np.ndarray, N_p: int, method: str) -> np.ndarray:
+    """split_weighted over precomputed prefix sums, O(N_p log N) for method='prefix'."""
+    if N_p <= 0:
+        raise Exception('N_p must be non-zero')
+    if method not in ('prefix', 'optimal'):
+        raise ValueError(f"unknown partitioning method: {method}")
+    targets = prefix[-1] * np.arange(1, N_p) / N_p
+    after = np.searchsorted(prefix, targets, side='left')
+    before = np.maximum(after - 1, 0)
+    cuts = np.where(targets - prefix[before] < prefix[after] - targets, before, after)
+    bounds = np.concatenate([[0], cuts, [len(prefix) - 1]])
+    if method == 'optimal' and len(prefix) > 1:
+        bounds = _optimal_bounds(prefix, N_p, bounds)
+    return _bounds_to_ranges(bounds)
+
+
+def _grid_neighbours(index_grids: list[np.ndarray]) -> np.ndarray:
+    """
+    (N, 2 * ndim) curve indices of the neighbours of every curve index along each axis
+    of its own grid (up/down/left/right for 2D grids), -1 where the neighbour is
+    outside of the grid.
+    """
+    total = sum(np.size(grid) for grid in index_grids)
+    ndim = max(np.ndim(grid) for grid in index_grids)
+    neighbours = np.full((total, 2 * ndim), -1, dtype=np.int64)
+    for grid in index_grids:
+        padded = np.pad(grid, 1, constant_values=-1)
+        inner = [slice(1, -1)] * grid.ndim
+        shifted = []
+        for axis in range(grid.ndim):
+            for side in (slice(None, -2), slice(2, None)):
+                index = list(inner)
+                index[axis] = side
+                shifted.append(padded[tuple(index)])
+        neighbours[np.ravel(grid), :len(shifted)] = np.stack([np.ravel(s) for s in shifted], axis=1)
+    return neighbours
+
+
+@profiling.profiled('distribute.refine_boundaries', cells=lambda ranges, *args, **kwargs: int(ranges[-1, 1]))
+def refine_boundaries(ranges: np.ndarray, index_grids: list[np.ndarray], weights=None,
+                      tolerance: float = 0.0, max_shift: int = 32, passes: int = 4) -> np.ndarray:
+    """
+    Post-pass for contiguous ranges (from split_into_ranges or split_weighted): moves
+    every boundary by up to max_shift points along the curve where that reduces the
+    number of cut edges between processors, i.e. the total perimeter of
+    benchmark/perimeter_sum.py. index_grids are the xy_to_index grids (or
+    Map.tile_curves, or 3D xyz_to_index grids) the curve runs through; only edges
+    inside a grid are counted.
+    Processor loads are kept within (1 + tolerance) times the initial maximum load,
+    so tolerance trades balance for less communication.
+    """
+    bounds = np.concatenate([ranges[:, 0], ranges[-1:, 1]])
+    if np.any(np.diff(bounds) < 0) or np.any(ranges[1:, 0] != ranges[:-1, 1]):
+        raise ValueError("refine_boundaries needs contiguous ranges in curve order")
+    n = bounds[-1]
+    prefix = _prefix_sums(np.ones(n) if weights is None else weights)
+    limit = (1 + tolerance) * np.max(np.diff(prefix[bounds]))
+    neighbours = _grid_neighbours(index_grids)
+    owner = ranges_to_mapping(ranges)
+
+    for _ in range(passes):
+        improved = False
+        for k in range(1, len(bounds) - 1):
+            best_shift, best_gain = 0, 0
+            for direction in (1, -1):
+                # moving right hands the cells after the boundary to the left processor and vice versa
+                src, dst = (k, k - 1) if direction == 1 else (k - 1, k)
+                gain = 0
+                moved = []
+                for step in range(1, max_shift + 1):
+                    boundary = bounds[k] + direction * step
+                    if not bounds[k - 1] < boundary < bounds[k + 1]:
+                        break
+                    cell = boundary - 1 if direction == 1 else boundary
+                    near = neighbours[cell][neighbours[cell] >= 0]
+                    gain += np.count_nonzero(owner[near] == dst) - np.count_nonzero(owner[near] == src)
+                    owner[cell] = dst
+                    moved.append(cell)
+                    fits = (prefix[boundary] - prefix[bounds[k - 1]] <= limit
+                            and prefix[bounds[k + 1]] - prefix[boundary] <= limit)
+                    if fits and gain > best_gain:
+                        best_shift, best_gain = direction * step, gain
+                owner[moved] = src
+            if best_shift:
+                lo, hi = sorted((bounds[k], bounds[k] + best_shift))
+                owner[lo:hi] = k - 1 if best_shift > 0 else k
+                bounds[k] += best_shift
+                improved = True
+        if not improved:
+            break
+    return _bounds_to_ranges(bounds)
+
+
+def _prefix_loads(ranges: np.ndarray, prefix=None) -> np.ndarray:
+    """Loads of the ranges from prefix sums of the weights (number of points when prefix is None)."""
+    if prefix is None:
+        return ranges[:, 1] - ranges[:, 0]
+    return prefix[ranges[:, 1]] - prefix[ranges[:, 0]]
+
+
+def load_imbalance(loads) -> float:
+    """Maximum processor load over the mean load (1.0 is perfect)."""
+    loads = np.asarray(loads)
+    mean = loads.sum() / len(loads)
+    return float(loads.max() / mean) if mean > 0 else 1.0
+
+
+def _prefix_imbalance(ranges: np.ndarray, prefix=None) -> float:
+    return load_imbalance(_prefix_loads(ranges, prefix))
+
+
+def range_loads(ranges: np.ndarray, weights=None) -> np.ndarray:
+    """Total weight of every processor's range (number of points when weights is None)."""
+    return _prefix_loads(ranges, None if weights is None else _prefix_sums(weights))
+
+
+def imbalance(ranges: np.ndarray, weights=None) -> float:
+    """Imbalance factor of a partition: maximum processor load over the mean load (1.0 is perfect)."""
+    return _prefix_imbalance(ranges, None if weights is None else _prefix_sums(weights))
+
+
+def ranges_to_mapping(ranges: np.ndarray) -> np.ndarray:
+    """Expands per-processor [start, end) ranges into the processor of every curve index."""
+    order = np.lexsort((ranges[:, 1], ranges[:, 0]))
+    return np.repeat(order, ranges[order, 1] - ranges[order, 0])
+
+
+def mapping_to_ranges(proc_mapping: np.ndarray) -> np.ndarray:
+    """
+    Inverse of ranges_to_mapping: the [start, end) curve indices of every processor of
+    a mapping in which each processor owns one contiguous chunk of the curve.
+    Processors that own no points get an empty range.
+    """
+    proc_mapping = np.asarray(proc_mapping)
+    if not len(proc_mapping):
+        return np.zeros((0, 2), dtype=np.int64)
+    cuts = np.flatnonzero(np.diff(proc_mapping)) + 1
+    starts = np.concatenate([[0], cuts])
+    owners = proc_mapping[starts]
+    if len(np.unique(owners)) != len(owners):
+        raise ValueError("proc_mapping gives some processor more than one chunk of the curve")
+    ranges = np.zeros((int(proc_mapping.max()) + 1, 2), dtype=np.int64)
+    ranges[owners] = np.stack([starts, np.append(cuts, len(proc_mapping))], axis=1)
+    return ranges
+
+
+def lookup_processors(ranges: np.ndarray, indices) -> np.ndarray:
+    """
+    Processors owning the given curve indices (any shape, e.g. an xy_to_index grid),
+    found by binary search over the ranges instead of an N-length mapping.
+    """
+    order = np.lexsort((ranges[:, 1], ranges[:, 0]))
+    return order[np.searchsorted(ranges[order, 1], indices, side='right')]
+
+
+def processors_of(indices, proc_mapping=None, ranges=None) -> np.ndarray:
+    """
+    Processors owning the given curve indices, taken from an N-length proc_mapping or
+    looked up in the (N_p, 2) ranges, so callers can accept either one.
+    """
+    if (proc_mapping is None) == (ranges is None):
+        raise ValueError('give exactly one of proc_mapping and ranges')
+    if ranges is not None:
+        return lookup_processors(np.asarray(ranges), indices)
+    return np.asarray(proc_mapping)[indices]
+
+
+@profiling.profiled('distribute.split_into_processors', cells=lambda N, N_p: N)
 def split_into_processors(N: int, N_p: int) -> np.array:
     if N_p <= 0:
         raise Exception('N_p must be non-zero')
     if N_p > N:
         return np.arange(N)
+    return ranges_to_mapping(split_into_ranges(N, N_p))
+
+
+def hierarchy_groups(topology: list[int]) -> np.ndarray:
+    """
+    (len(topology), N_p) group of every leaf processor at every level of the topology,
+    e.g. [nodes, sockets_per_node, cores_per_socket]. Leaf processors are numbered
+    node-major, so row 0 holds the node, row 1 the socket (counted over all nodes)
+    and the last row the processor itself.
+    """
+    topology = list(topology)
+    if not topology or any(n <= 0 for n in topology):
+        raise ValueError(f"topology must be a list of positive group sizes, got {topology}")
+    ranks = np.arange(int(np.prod(topology)))
+    below = np.cumprod(topology[::-1])[::-1]  # leaf processors under one group of every level
+    return np.stack([ranks // (below[level] // topology[level]) for level in range(len(topology))])
+
+
+@profiling.profiled('distribute.split_hierarchical', cells=lambda N, *args, **kwargs: N)
+def split_hierarchical(N: int, topology: list[int], weights=None, method: str = 'prefix') -> np.ndarray:
+    """
+    Splits the curve level by level: first into topology[0] chunks (nodes), then every
+    chunk into topology[1] chunks (sockets) and so on, so that each group of the
+    hardware hierarchy owns a contiguous piece of the curve. Returns (prod(topology), 2)
+    ranges of the leaf processors, numbered as in hierarchy_groups.
+
+    Without weights every level splits its chunks like split_into_ranges, with
+    weights like split_weighted with the given method.
+    """
+    hierarchy_groups(topology)  # validates the topology
+    prefix = None
+    if weights is not None:
+        prefix = _prefix_sums(weights)
+        if len(prefix) - 1 != N:
+            raise ValueError(f"got {len(prefix) - 1} weights for {N} points")
+
+    ranges = np.array([[0, N]])
+    for n in topology:
+        chunks = []
+        for start, end in ranges:
+            if prefix is None:
+                chunks.append(split_into_ranges(end - start, n) + start)
+            else:
+                chunks.append(_split_prefix(prefix[start:end + 1] - prefix[start], n, method) + start)
+        ranges = np.concatenate(chunks)
+    return ranges
+
+
+def migration_list(old_ranges: np.ndarray, new_ranges: np.ndarray) -> np.ndarray:
+    """
+    Curve-index intervals that change processor between two partitions of the same
+    curve, as a (K, 4) array of [start, end, old processor, new processor] rows.
+    K is at most the total number of ranges, however many points move.
+    """
+    if old_ranges[:, 1].max() != new_ranges[:, 1].max():
+        raise ValueError("partitions of curves of different length can't be compared")
+    bounds = np.union1d(old_ranges.ravel(), new_ranges.ravel())
+    starts, ends = bounds[:-1], bounds[1:]
+    src = lookup_processors(old_ranges, starts)
+    dst = lookup_processors(new_ranges, starts)
+    moved = src != dst
+    return np.stack([starts[moved], ends[moved], src[moved], dst[moved]], axis=1)
+
+
+def migration_volume(old_ranges: np.ndarray, new_ranges: np.ndarray) -> np.ndarray:
+    """Points moving between every pair of processors, as (K, 3) rows of [old, new, points]."""
+    moves = migration_list(old_ranges, new_ranges)
+    n_p = max(len(old_ranges), len(new_ranges))
+    pairs, inverse = np.unique(moves[:, 2] * n_p + moves[:, 3], return_inverse=True)
+    points = np.bincount(inverse, weights=moves[:, 1] - moves[:, 0]).astype(np.int64)
+    return np.stack([pairs // n_p, pairs % n_p, points], axis=1)
+
+
+def relabel_ranges(old_ranges: np.ndarray, new_ranges: np.ndarray) -> np.ndarray:
+    """
+    Renumbers the processors of new_ranges so that as many points as possible keep
+    their processor from old_ranges. Returns the same chunks with rows permuted.
+
+    Chunks of both partitions are contiguous along the curve, so two pairs of
+    overlapping (old, new) chunks never cross. The best matching is then found
+    exactly by a dynamic program along the O(N_p) segments between all bounds,
+    instead of a general assignment problem.
+    """
+    n_p = len(new_ranges)
+    bounds = np.union1d(old_ranges.ravel(), new_ranges.ravel())
+    starts = bounds[:-1]
+    old = lookup_processors(old_ranges, starts)
+    new = lookup_processors(new_ranges, starts)
+    overlap = np.diff(bounds)
+
+    # state: (old chunk already matched, new chunk already matched) for the current segment's chunks
+    best = {(False, False): (0, None)}
+    history = []
+    for k in range(len(starts)):
+        fresh_old = k == 0 or old[k] != old[k - 1]
+        fresh_new = k == 0 or new[k] != new[k - 1]
+        states = {}
+        for (old_used, new_used), (value, _) in best.items():
+            state = (old_used and not fresh_old, new_used and not fresh_new)
+            candidates = [(state, value, False)]
+            if not state[0] and not state[1] and old[k] < n_p:
+                candidates.append(((True, True), value + overlap[k], True))
+            for target, target_value, taken in candidates:
+                if target not in states or target_value > states[target][0]:
+                    states[target] = (target_value, ((old_used, new_used), taken))
+        history.append(states)
+        best = states
+
+    labels = np.full(n_p, -1, dtype=np.int64)
+    state = max(best, key=lambda st: best[st][0])
+    for k in range(len(starts) - 1, -1, -1):
+        previous, taken = history[k][state][1]
+        if taken:
+            labels[new[k]] = old[k]
+        state = previous
+    free = np.setdiff1d(np.arange(n_p), labels)
+    labels[labels < 0] = free[:np.count_nonzero(labels < 0)]
+
+    relabeled = np.empty_like(new_ranges)
+    relabeled[labels] = new_ranges
+    return relabeled
+
+
+def _moved_points(old_ranges: np.ndarray, new_ranges: np.ndarray) -> int:
+    moves = migration_list(old_ranges, new_ranges)
+    return int(np.sum(moves[:, 1] - moves[:, 0]))
+
+
+def minimize_migration(old_ranges: np.ndarray, new_ranges: np.ndarray, weights=None,
+                       tolerance: float = 0.0) -> np.ndarray:
+    """
+    Turns new_ranges (contiguous, in curve order) into a partition that moves as few
+    points away from old_ranges as possible. Processors are relabeled with
+    relabel_ranges; with a positive tolerance, cuts are first snapped to the nearest
+    old cut where the loads of both neighbouring processors stay within
+    (1 + tolerance) times the maximum load of new_ranges.
+    """
+    prefix = _prefix_sums(weights) if weights is not None and tolerance > 0 else None
+    return _minimize_migration(old_ranges, new_ranges, prefix, tolerance)
+
+
+@profiling.profiled('distribute.minimize_migration')
+def _minimize_migration(old_ranges: np.ndarray, new_ranges: np.ndarray, prefix, tolerance: float) -> np.ndarray:
+    """
+    minimize_migration over precomputed prefix sums (None for uniform weights), only
+    reads the prefix sums at the cuts, so the cost doesn't depend on N.
+    """
+    candidates = [relabel_ranges(old_ranges, new_ranges)]
+    if tolerance > 0:
+        bounds = np.concatenate([new_ranges[:, 0], new_ranges[-1:, 1]])
+        if prefix is None:
+            def load(a, b):
+                return b - a
+        else:
+            def load(a, b):
+                return prefix[b] - prefix[a]
+        limit = (1 + tolerance) * np.max(load(bounds[:-1], bounds[1:]))
+        old_bounds = np.unique(old_ranges.ravel())
+        for k in range(1, len(bounds) - 1):
+            i = np.searchsorted(old_bounds, bounds[k])
+            near = [b for b in old_bounds[max(i - 1, 0):i + 1] if bounds[k - 1] < b < bounds[k + 1]]
+            for b in sorted(near, key=lambda b: abs(b - bounds[k])):
+                if load(bounds[k - 1], b) <= limit and load(b, bounds[k + 1]) <= limit:
+                    bounds[k] = b
+                    break
+        candidates.append(relabel_ranges(old_ranges, _bounds_to_ranges(bounds)))
+    return min(candidates, key=lambda ranges: _moved_points(old_ranges, ranges))
+
+
+class PartitionSession:
+    """
+    Repartitions one mesh many times, e.g. for different processor counts or updated
+    point costs. The curve order and the prefix sums of the weights are kept between
+    calls, so a repartition only places N_p cuts by binary search, and the previous
+    ranges are kept to report what moved.
+    """
+
+    def __init__(self, index_grids: list[np.ndarray], weights=None, method: str = 'prefix'):
+        """
+        Args:
+            index_grids: curve index of every cell, e.g. [xy_to_index] or Map.tile_curves
+            weights: cost of every point, in curve order or as per-grid arrays; uniform if None
+            method: partitioning method of split_weighted
+        """
+        self.index_grids = index_grids
+        self.n = sum(np.size(grid) for grid in index_grids)
+        self.method = method
+        self.ranges = None
+        self._prefix = None
+        self.set_weights(weights)
+
+    def set_weights(self, weights=None):
+        """Replaces the point costs, the only O(N) step of the session."""
+        if weights is None:
+            weights = np.ones(self.n)
+        elif len(weights) and np.ndim(weights[0]) > 0:
+            # a sequence of per-grid arrays rather than one weight per point
+            weights = weights_in_curve_order(self.index_grids, weights)
+        if len(weights) != self.n:
+            raise ValueError(f"{len(weights)} weights given for {self.n} points")
+        self._prefix = _prefix_sums(weights)
+
+    @profiling.profiled('distribute.repartition', cells=lambda self, *args, **kwargs: self.n)
+    def repartition(self, N_p: int, weights=None, relabel: bool = False,
+                    tolerance: float = 0.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Splits the curve for N_p processors. Returns the new ranges and the
+        migration_list from the previous partition (empty on the first call).
+        With relabel, processors are renumbered (and cuts moved within tolerance)
+        by minimize_migration to keep as many points in place as possible.
+        """
+        if weights is not None:
+            self.set_weights(weights)
+        ranges = _split_prefix(self._prefix, N_p, self.method)
+        if relabel and self.ranges is not None:
+            ranges = _minimize_migration(self.ranges, ranges, self._prefix, tolerance)
+        if self.ranges is None:
+            migration = np.zeros((0, 4), dtype=np.int64)
+        else:
+            migration = migration_list(self.ranges, ranges)
+        self.ranges = ranges
+        return ranges, migration
+
+    def _check_partitioned(self):
+        if self.ranges is None:
+            raise ValueError('no partition yet, call repartition first')
+
+    def imbalance(self) -> float:
+        self._check_partitioned()
+        return _prefix_imbalance(self.ranges, self._prefix)
 
-    points_per_processor = N // N_p
-    mapping = np.zeros(N, dtype=int)
-    for index in range(N):
-        processor = min(index // points_per_processor, N_p - 1)
-        mapping[index] = processor
-    return mapping
+    def processor_grids(self) -> list[np.ndarray]:
+        """Processor of every cell of every index grid for the current ranges."""
+        self._check_partitioned()
+        return [lookup_processors(self.ranges, grid) for grid in self.index_grids]
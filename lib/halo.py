@@ -0,0 +1,144 @@
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from lib import profiling
+from lib.map.adjacency import Seam, map_edges
+from lib.map.map import Map
+
+
+@dataclass
+class HaloExchange:
+    """
+    Ghost cells every processor receives and the cells it sends, in CSR layout:
+    processor r receives recv_cells[recv_offsets[r]:recv_offsets[r + 1]] from the
+    processors in recv_from at the same positions, and sends
+    send_cells[send_offsets[r]:send_offsets[r + 1]] to send_to. Both lists are
+    sorted by peer and then by curve index, so the cells r receives from q come in
+    the same order as the cells q sends to r.
+    """
+    width: int
+    recv_offsets: np.ndarray
+    recv_cells: np.ndarray
+    recv_from: np.ndarray
+    send_offsets: np.ndarray
+    send_cells: np.ndarray
+    send_to: np.ndarray
+
+    def recv(self, rank: int) -> tuple[np.ndarray, np.ndarray]:
+        """Ghost cells of the processor and their owners."""
+        lo, hi = self.recv_offsets[rank], self.recv_offsets[rank + 1]
+        return self.recv_cells[lo:hi], self.recv_from[lo:hi]
+
+    def send(self, rank: int) -> tuple[np.ndarray, np.ndarray]:
+        """Cells the processor sends and the processors they go to."""
+        lo, hi = self.send_offsets[rank], self.send_offsets[rank + 1]
+        return self.send_cells[lo:hi], self.send_to[lo:hi]
+
+
+def _adjacency(edges: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """CSR (indptr, neighbours) of the undirected cell graph."""
+    src = np.concatenate([edges[:, 0], edges[:, 1]])
+    dst = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.argsort(src, kind='stable')
+    return np.searchsorted(src[order], np.arange(n + 1)), dst[order]
+
+
+def _expand(indptr: np.ndarray, neighbours: np.ndarray, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """All neighbours of the cells, with the position in cells each one came from."""
+    counts = indptr[cells + 1] - indptr[cells]
+    source = np.repeat(np.arange(len(cells)), counts)
+    step = np.arange(len(source)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return source, neighbours[indptr[cells][source] + step]
+
+
+@profiling.profiled('halo.build_halo_exchange', cells=lambda tile_map, *args, **kwargs: tile_map.get_total_n())
+def build_halo_exchange(tile_map: Map, proc_mapping: np.ndarray, width: int = 1,
+                        seams: Iterable[Seam] = ()) -> HaloExchange:
+    """
+    Builds the halo exchange lists of a partition of the map. The halo of a processor
+    is every cell of another processor within width steps of one of its own cells,
+    following the edges of map_edges: inside tiles, across the seams implied by
+    NextConnect and across the extra seams given. The layers are grown for all
+    processors at once, as sets of (processor, cell) pairs.
+    """
+    if width < 0:
+        raise ValueError(f"halo width must be non-negative, got {width}")
+    owner = np.asarray(proc_mapping).astype(np.int64)
+    n = len(owner)
+    if n != tile_map.get_total_n():
+        raise ValueError(f"proc_mapping has {n} entries, map has {tile_map.get_total_n()} points")
+    n_p = int(owner.max()) + 1 if n else 0
+    indptr, neighbours = _adjacency(map_edges(tile_map, seams), n)
+
+    # (processor, ghost cell) pairs as processor * n + cell
+    found = np.zeros(0, dtype=np.int64)
+    ranks, cells = owner, np.arange(n)
+    for _ in range(width):
+        source, near = _expand(indptr, neighbours, cells)
+        near_ranks = ranks[source]
+        foreign = owner[near] != near_ranks
+        keys = np.setdiff1d(np.unique(near_ranks[foreign] * n + near[foreign]), found, assume_unique=True)
+        if not len(keys):
+            break
+        found = np.union1d(found, keys)
+        ranks, cells = np.divmod(keys, n)
+
+    ranks, cells = np.divmod(found, n)
+    owners = owner[cells]
+    recv = np.lexsort((cells, owners, ranks))
+    send = np.lexsort((cells, ranks, owners))
+    return HaloExchange(
+        width=width,
+        recv_offsets=np.searchsorted(ranks[recv], np.arange(n_p + 1)),
+        recv_cells=cells[recv].astype(np.int32),
+        recv_from=owners[recv].astype(np.int32),
+        send_offsets=np.searchsorted(owners[send], np.arange(n_p + 1)),
+        send_cells=cells[send].astype(np.int32),
+        send_to=ranks[send].astype(np.int32),
+    )
+
+
+def _fingerprint(tile_map: Map, proc_mapping: np.ndarray, width: int, seams: Iterable[Seam]) -> str:
+    """Hash of everything the exchange lists depend on."""
+    digest = hashlib.sha256()
+    digest.update(repr((tile_map.tiles, list(seams), width)).encode())
+    digest.update(np.asarray(proc_mapping).astype('<i8').tobytes())
+    return digest.hexdigest()
+
+
+def save_halo_exchange(halo: HaloExchange, path: str | Path, fingerprint: str = ''):
+    """Writes the exchange lists into an .npz archive, e.g. next to the mapping."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        np.savez(f, fingerprint=np.array(fingerprint), **vars(halo))
+
+
+def load_halo_exchange(path: str | Path) -> tuple[HaloExchange, str]:
+    """Reads exchange lists written by save_halo_exchange, with the fingerprint they were saved with."""
+    with np.load(path) as archive:
+        fields = {name: archive[name] for name in archive.files}
+    fingerprint = str(fields.pop('fingerprint'))
+    fields['width'] = int(fields['width'])
+    return HaloExchange(**fields), fingerprint
+
+
+def cached_halo_exchange(tile_map: Map, proc_mapping: np.ndarray, path: str | Path, width: int = 1,
+                         seams: Iterable[Seam] = ()) -> HaloExchange:
+    """
+    build_halo_exchange backed by a file: the lists are loaded from path when it was
+    written for the same tiles, seams, width and mapping, and rebuilt and saved otherwise.
+    """
+    seams = list(seams)
+    fingerprint = _fingerprint(tile_map, proc_mapping, width, seams)
+    if Path(path).exists():
+        halo, saved = load_halo_exchange(path)
+        if saved == fingerprint:
+            return halo
+    halo = build_halo_exchange(tile_map, proc_mapping, width, seams)
+    save_halo_exchange(halo, path, fingerprint)
+    return halo
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+from lib.map.map import Map
+from lib.map.tile import NextConnect, CornerPlace
+
+
+@dataclass
+class Seam:
+    """
+    Adjacency between two tile sides that isn't implied by NextConnect, e.g. the
+    remaining edges of a cube. Cells along side_a are paired in order (left to right,
+    top to bottom) with cells along side_b, or with them reversed.
+    """
+    tile_a: int
+    side_a: NextConnect
+    tile_b: int
+    side_b: NextConnect
+    reverse: bool = False
+
+
+_OPPOSITE = {
+    NextConnect.TOP: NextConnect.BOTTOM,
+    NextConnect.BOTTOM: NextConnect.TOP,
+    NextConnect.LEFT: NextConnect.RIGHT,
+    NextConnect.RIGHT: NextConnect.LEFT,
+}
+
+
+def side_indices(curve: np.ndarray, side: NextConnect) -> np.ndarray:
+    """Curve indices of the cells along a tile side, left to right or top to bottom."""
+    match side:
+        case NextConnect.TOP:
+            return curve[0, :]
+        case NextConnect.BOTTOM:
+            return curve[-1, :]
+        case NextConnect.LEFT:
+            return curve[:, 0]
+        case NextConnect.RIGHT:
+            return curve[:, -1]
+
+
+def _chain_seam(tile_map: Map, t: int) -> np.ndarray:
+    """Edges across the side through which the curve of tile t continues into tile t + 1."""
+    conn = tile_map.tiles[t].next_conn
+    a = side_indices(tile_map.tile_curves[t], conn)
+    b = side_indices(tile_map.tile_curves[t + 1], _OPPOSITE[conn])
+    # tiles of different sizes are aligned at the corner where the curve crosses the seam
+    start = tile_map.tiles[t + 1].start
+    if conn in (NextConnect.LEFT, NextConnect.RIGHT):
+        aligned_first = start in (CornerPlace.TOP_LEFT, CornerPlace.TOP_RIGHT)
+    else:
+        aligned_first = start in (CornerPlace.TOP_LEFT, CornerPlace.BOT_LEFT)
+    n = min(len(a), len(b))
+    if aligned_first:
+        return np.stack([a[:n], b[:n]], axis=1)
+    return np.stack([a[len(a) - n:], b[len(b) - n:]], axis=1)
+
+
+def _extra_seam(tile_map: Map, seam: Seam) -> np.ndarray:
+    a = side_indices(tile_map.tile_curves[seam.tile_a], seam.side_a)
+    b = side_indices(tile_map.tile_curves[seam.tile_b], seam.side_b)
+    if len(a) != len(b):
+        raise ValueError(f"sides of different length can't be joined: {seam}")
+    return np.stack([a, b[::-1] if seam.reverse else b], axis=1)
+
+
+def map_edges(tile_map: Map, seams: Iterable[Seam] = ()) -> np.ndarray:
+    """
+    All pairs of neighbouring cells of the map as an (E, 2) array of curve indices,
+    every edge once: neighbours inside each tile, across the seams between
+    consecutive tiles implied by NextConnect and across the extra seams given.
+    """
+    edges = []
+    for curve in tile_map.tile_curves:
+        edges.append(np.stack([curve[:-1, :].ravel(), curve[1:, :].ravel()], axis=1))
+        edges.append(np.stack([curve[:, :-1].ravel(), curve[:, 1:].ravel()], axis=1))
+    for t in range(len(tile_map.tiles) - 1):
+        edges.append(_chain_seam(tile_map, t))
+    for seam in seams:
+        edges.append(_extra_seam(tile_map, seam))
+    return np.concatenate(edges).astype(np.int64)
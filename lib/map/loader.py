@@ -24,8 +24,9 @@ def load_tile_dtos(json_path: str | Path) -> List[TileDTO]:
     Example JSON format:
     [
         {"width": 2, "height": 3, "connection": "RIGHT"},
-        {"width": 4, "height": 5, "connection": "BOTTOM"}
+        {"width": 4, "height": 5, "connection": "BOTTOM", "curve": "snake"}
     ]
+    "curve" is optional and names a backend from lib.curves.CURVES (gilbert by default).
     """
     path = Path(json_path)
     if not path.exists():
@@ -39,7 +40,8 @@ def load_tile_dtos(json_path: str | Path) -> List[TileDTO]:
         try:
             connection = NextConnect[config['connection'].upper()]
             tile_dtos.append(
-                TileDTO(width=config['width'], height=config['height'], next_conn=connection)
+                TileDTO(width=config['width'], height=config['height'], next_conn=connection,
+                        curve=config.get('curve', 'gilbert'))
             )
         except KeyError as e:
             raise ValueError(f"Invalid connection type: {config['connection']}") from e
@@ -1,8 +1,14 @@
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from itertools import repeat
+from multiprocessing import shared_memory
+from typing import Optional
 
 import numpy as np
 
-from lib.map.tile import Tile, construct_curve, NextConnect, CornerPlace
+from lib import profiling
+from lib.map.tile import (Tile, canonical_key, construct_curve, curve_positions, resolve_end, tile_mappings,
+                          NextConnect, CornerPlace)
 
 
 @dataclass
@@ -10,6 +16,7 @@ class TileDTO:
     width: int
     height: int
     next_conn: NextConnect
+    curve: str = 'gilbert'
 
 def _get_next_start(end: CornerPlace, next_conn: NextConnect) -> CornerPlace:
     match next_conn:
@@ -35,29 +42,97 @@ def _get_next_start(end: CornerPlace, next_conn: NextConnect) -> CornerPlace:
                 return CornerPlace.BOT_LEFT
 
 
+def _fill_tile(buffer: np.ndarray, tile: Tile, offset: int, mappings: Optional[tuple[np.ndarray, np.ndarray]] = None):
+    """
+    Writes the curve of the tile and the row and column of its curve indices into a
+    (3, total_n) buffer, both taken from one (index_to_xy, xy_to_index) pair.
+    """
+    size = tile.width * tile.height
+    if mappings is None:
+        mappings = tile_mappings(tile)
+    curve, _ = construct_curve(tile, mappings)
+    np.add(curve, offset, out=buffer[0, offset:offset + size].reshape(tile.height, tile.width))
+    buffer[1, offset:offset + size], buffer[2, offset:offset + size] = curve_positions(tile, mappings)
+
+
+def _fill_tile_shared(shm_name: str, total_n: int, tile: Tile, offset: int):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        _fill_tile(np.ndarray((3, total_n), dtype=np.int32, buffer=shm.buf), tile, offset)
+    finally:
+        shm.close()
+
+
+def _fill_tiles_parallel(tiles: list[Tile], offsets: list[int], total_n: int, workers: int) -> np.ndarray:
+    """Fills the tiles in a process pool, every process writing its tiles straight into one shared block."""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 3 * total_n * np.dtype(np.int32).itemsize))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_fill_tile_shared, repeat(shm.name), repeat(total_n), tiles, offsets))
+        shared = np.ndarray((3, total_n), dtype=np.int32, buffer=shm.buf)
+        buffer = shared.copy()
+        del shared
+        return buffer
+    finally:
+        shm.close()
+        shm.unlink()
+
+
 class Map:
-    def __init__(self, tiles: list[TileDTO]):
+    def __init__(self, tiles: list[TileDTO], workers: Optional[int] = None):
+        """
+        Args:
+            tiles: tiles in curve order
+            workers: build the tile curves in a pool of this many processes. The start
+                and end corners of all tiles are resolved beforehand, so the tiles
+                don't depend on each other.
+        """
+        total_n = sum(t.width * t.height for t in tiles)
+        if total_n > np.iinfo(np.int32).max:
+            raise ValueError(f"map of {total_n} points doesn't fit int32 indices")
+        with profiling.stage('map.build', cells=total_n):
+            self._build(tiles, total_n, workers)
+
+    def _build(self, tiles: list[TileDTO], total_n: int, workers: Optional[int]):
         self.tiles = []
-        self.tile_curves = []
-        self.ind_to_tyx = [(-1, -1, -1)] * sum(t.width * t.height for t in tiles)
         next_start = CornerPlace.TOP_LEFT
-        offset = 0
         for tile in tiles:
-            self.tiles.append(Tile(tile.width, tile.height, next_start, tile.next_conn))
-            curve, end = construct_curve(self.tiles[-1])
-            next_start = _get_next_start(end, tile.next_conn)
-            curve += offset
-            offset += np.size(curve)
-            self.tile_curves.append(curve)
-            for y in range(np.size(curve, 0)):
-                for x in range(np.size(curve, 1)):
-                    self.ind_to_tyx[curve[y][x]] = (len(self.tile_curves) - 1, y, x)
+            self.tiles.append(Tile(tile.width, tile.height, next_start, tile.next_conn, tile.curve))
+            next_start = _get_next_start(resolve_end(self.tiles[-1]), tile.next_conn)
+
+        sizes = [t.width * t.height for t in self.tiles]
+        offsets = np.cumsum([0] + sizes)[:-1].tolist()
+        if workers is not None and workers > 1:
+            buffer = _fill_tiles_parallel(self.tiles, offsets, total_n, workers)
+        else:
+            buffer = np.empty((3, total_n), dtype=np.int32)
+            # held here, so curves too large for curve_cache are still built once per key
+            mappings = {}
+            for tile, offset in zip(self.tiles, offsets):
+                key = canonical_key(tile)
+                if key not in mappings:
+                    mappings[key] = tile_mappings(tile)
+                _fill_tile(buffer, tile, offset, mappings[key])
+
+        # every tile owns a contiguous range of curve indices
+        self.tile_curves = [buffer[0, offset:offset + size].reshape(tile.height, tile.width)
+                            for tile, offset, size in zip(self.tiles, offsets, sizes)]
+        # inverse of tile_curves: tile, row and column of every curve index
+        self.ind_t = np.repeat(np.arange(len(self.tiles), dtype=np.int32), sizes)
+        self.ind_y = buffer[1]
+        self.ind_x = buffer[2]
 
     def get_ind(self, t: int, y: int, x: int):
         return self.tile_curves[t][y, x]
 
-    def get_by_ind(self, sf_index: int) -> tuple[int, int, int]:
-        return self.ind_to_tyx[sf_index]
+    def get_by_ind(self, sf_index):
+        """
+        Tile, row and column of a curve index. An array of indices gives a tuple
+        of arrays (t, y, x) of the same shape.
+        """
+        if np.ndim(sf_index) == 0:
+            return int(self.ind_t[sf_index]), int(self.ind_y[sf_index]), int(self.ind_x[sf_index])
+        return self.ind_t[sf_index], self.ind_y[sf_index], self.ind_x[sf_index]
 
     def get_total_n(self) -> int:
         return sum(t.width*t.height for t in self.tiles)
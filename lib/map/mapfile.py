@@ -0,0 +1,111 @@
+import json
+import struct
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from lib import profiling
+from lib.map.map import Map
+from lib.map.tile import Tile, CornerPlace, NextConnect
+
+# File layout:
+#   8 bytes  magic
+#   8 bytes  little-endian length of the JSON header
+#   JSON header: tile dims, corners and connections, array positions
+#   padding up to a multiple of _ALIGN
+#   raw little-endian int32 arrays, each starting at a multiple of _ALIGN
+_MAGIC = b'SFCMAP\x00\x01'
+_ALIGN = 64
+_DTYPE = np.dtype('<i4')
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+class MappedMap(Map):
+    """
+    Read-only Map loaded from a file written by save_map_file. tile_curves, the index
+    tables and proc_mapping are numpy.memmap views, so opening is cheap and processes
+    that open the same file share its pages through the page cache.
+    """
+
+    def __init__(self, path: str | Path):
+        path = Path(path)
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"not a map file: {path}")
+            (header_len,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len))
+
+        data_start = _aligned(len(_MAGIC) + 8 + header_len)
+        total_n = header['total_n']
+        arrays = header['arrays']
+
+        def view(name: str) -> np.ndarray:
+            return np.memmap(path, dtype=_DTYPE, mode='r', offset=data_start + arrays[name], shape=(total_n,))
+
+        self.tiles = [Tile(t['width'], t['height'], CornerPlace[t['start']], NextConnect[t['next_conn']],
+                           t.get('curve', 'gilbert'))
+                      for t in header['tiles']]
+        curves = view('tile_curves')
+        self.tile_curves = []
+        offset = 0
+        for tile in self.tiles:
+            size = tile.width * tile.height
+            self.tile_curves.append(curves[offset:offset + size].reshape(tile.height, tile.width))
+            offset += size
+        self.ind_t = view('ind_t')
+        self.ind_y = view('ind_y')
+        self.ind_x = view('ind_x')
+        self.proc_mapping = view('proc_mapping') if 'proc_mapping' in arrays else None
+
+
+@profiling.profiled('map.save_map_file', cells=lambda tile_map, *args, **kwargs: tile_map.get_total_n())
+def save_map_file(tile_map: Map, path: str | Path, proc_mapping: Optional[np.ndarray] = None):
+    """
+    Writes the map, and optionally the processor of every curve index, in the binary
+    format read by load_map_file.
+    """
+    total_n = tile_map.get_total_n()
+    arrays = {
+        'tile_curves': [curve.ravel() for curve in tile_map.tile_curves],
+        'ind_t': [tile_map.ind_t],
+        'ind_y': [tile_map.ind_y],
+        'ind_x': [tile_map.ind_x],
+    }
+    if proc_mapping is not None:
+        if len(proc_mapping) != total_n:
+            raise ValueError(f"proc_mapping has {len(proc_mapping)} entries, map has {total_n} points")
+        arrays['proc_mapping'] = [proc_mapping]
+
+    positions = {}
+    position = 0
+    for name in arrays:
+        positions[name] = position
+        position += _aligned(total_n * _DTYPE.itemsize)
+    header = json.dumps({
+        'version': 1,
+        'total_n': total_n,
+        'tiles': [{'width': t.width, 'height': t.height, 'start': t.start.name, 'next_conn': t.next_conn.name,
+                   'curve': t.curve}
+                  for t in tile_map.tiles],
+        'arrays': positions,
+    }).encode()
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        for name, parts in arrays.items():
+            for part in parts:
+                np.asarray(part).astype(_DTYPE, copy=False).tofile(f)
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+
+
+def load_map_file(path: str | Path) -> MappedMap:
+    return MappedMap(path)
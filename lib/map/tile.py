@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import lru_cache
 import typing
 from enum import Enum
 
@@ -43,12 +44,17 @@ def _check_curve(curve: np.array, start: CornerPlace, next_conn: NextConnect) ->
     """Checks whether the curve has given start and fits for next_conn and returns end of the curve (for next tile)"""
     n = np.shape(curve)[0]
     m = np.shape(curve)[1]
-    size = np.size(curve, None) # total number of elements
+    corners = {place: curve[pos] for place, pos in get_places(n, m).items()}
+    return _check_corners(corners, np.size(curve, None), start, next_conn)
+
+def _check_corners(corners: dict[CornerPlace, int], size: int, start: CornerPlace,
+                   next_conn: NextConnect) -> typing.Optional[CornerPlace]:
+    """Same as _check_curve, given only the curve values in the corners and the total number of elements"""
     end: CornerPlace = None
-    for place, pos in get_places(n, m).items():
-        if place == start and curve[pos] != 0:
+    for place, value in corners.items():
+        if place == start and value != 0:
             return None
-        if curve[pos] == size-1:
+        if value == size-1:
             if next_conn in _get_sides(place):
                 end = place
             else:
@@ -61,32 +67,116 @@ class Tile:
     height: int
     start: CornerPlace
     next_conn: NextConnect
+    curve: str = 'gilbert'  # name of the curve backend in curves.CURVES
+
+# Candidate orientations of the canonical curve as (transposed, fliplr, flipud), in the
+# order they are tried. The canonical curve is the curve of the tile's shape,
+# or, when transposed, the transposed curve of the swapped shape, so the 8
+# candidates cover all the symmetries of a square tile.
+_ORIENTATIONS = [
+    (False, False, False), (False, True, False), (False, False, True), (False, True, True),
+    (True, False, False), (True, True, False), (True, False, True), (True, True, True),
+]
+
+
+def _canonical_shape(width: int, height: int, transposed: bool) -> tuple[int, int]:
+    """(N, M) of the canonical curve an orientation of a width x height tile is taken from."""
+    return (width, height) if transposed else (height, width)
+
+
+def _oriented_curve(width: int, height: int, orientation: tuple[bool, bool, bool],
+                    name: str = 'gilbert', xy_to_index: typing.Optional[np.ndarray] = None) -> np.array:
+    """Read-only view of the cached (or given) canonical curve with the orientation applied."""
+    transposed, lr, ud = orientation
+    if xy_to_index is None:
+        xy_to_index = curves.curve_mappings(name, *_canonical_shape(width, height, transposed))[1]
+    curve = xy_to_index.T if transposed else xy_to_index
+    if lr:
+        curve = curve[:, ::-1]
+    if ud:
+        curve = curve[::-1, :]
+    return curve
+
+
+def _oriented_corners(width: int, height: int, orientation: tuple[bool, bool, bool],
+                      name: str = 'gilbert') -> dict[CornerPlace, int]:
+    """Corner values of _oriented_curve, from the curve endpoints only (-1 for other points)."""
+    transposed, lr, ud = orientation
+    if transposed:
+        endpoints = [(col, row) for row, col in curves.curve_endpoints(name, width, height)]
+    else:
+        endpoints = list(curves.curve_endpoints(name, height, width))
+    if lr:
+        endpoints = [(row, width - 1 - col) for row, col in endpoints]
+    if ud:
+        endpoints = [(height - 1 - row, col) for row, col in endpoints]
+    first, last = endpoints
+    return {place: 0 if pos == first else width * height - 1 if pos == last else -1
+            for place, pos in get_places(height, width).items()}
+
+
+@lru_cache(maxsize=1024)
+def _resolve_orientation(width: int, height: int, start: CornerPlace, next_conn: NextConnect,
+                         name: str = 'gilbert', backend=None) -> tuple[tuple[bool, bool, bool], CornerPlace]:
+    """
+    Finds the first orientation whose start and end corners fit the tile. Only the
+    endpoints of the canonical curve are needed, so no curve is generated here.
+    backend, the registered curves.CurveBackend, is only part of the cache key, so a
+    curve registered again under the same name is resolved again.
+    """
+    for orientation in _ORIENTATIONS:
+        corners = _oriented_corners(width, height, orientation, name)
+        if (end := _check_corners(corners, width * height, start, next_conn)) is not None:
+            return orientation, end
+    raise Exception(f"couldn't get matching sfcurve for {width} {height} {start} {next_conn}")
+
+
+def _tile_orientation(tile: Tile) -> tuple[tuple[bool, bool, bool], CornerPlace]:
+    return _resolve_orientation(tile.width, tile.height, tile.start, tile.next_conn, tile.curve,
+                                curves.CURVES.get(tile.curve))
+
+
+def resolve_end(tile: Tile) -> CornerPlace:
+    """End corner of construct_curve(tile), found without generating the curve."""
+    return _tile_orientation(tile)[1]
+
+
+def canonical_key(tile: Tile) -> tuple[str, int, int]:
+    """(curve, N, M) of the canonical curve the tile is oriented from, shared by tiles with the same key."""
+    (transposed, _, _), _ = _tile_orientation(tile)
+    return (tile.curve, *_canonical_shape(tile.width, tile.height, transposed))
+
+
+def tile_mappings(tile: Tile) -> tuple[np.ndarray, np.ndarray]:
+    """(index_to_xy, xy_to_index) of the canonical curve of the tile, see canonical_key."""
+    return curves.curve_mappings(*canonical_key(tile))
+
+
+def construct_curve(tile: Tile, mappings: typing.Optional[tuple[np.ndarray, np.ndarray]] = None) -> tuple[np.array, CornerPlace]:
+    """
+    Curve indices of the tile as a (height, width) array starting in tile.start and
+    ending in a corner on the tile.next_conn side. The result is a read-only view of
+    a curve shared by all tiles of the same size and curve. mappings, the
+    tile_mappings of the tile, saves looking the curve up again.
+    """
+    orientation, end = _tile_orientation(tile)
+    xy_to_index = mappings[1] if mappings is not None else None
+    return _oriented_curve(tile.width, tile.height, orientation, tile.curve, xy_to_index), end
+
 
-def _get_transposed_curve(width: int, height: int) -> np.array:
-    _, curve = curves.generate_hilbert_mappings(width, height)
-    return curve.transpose()
-
-def _check_ways(tile: Tile, curve: np.array) -> typing.Optional[tuple[np.array, CornerPlace]]:
-    if (end := _check_curve(curve, tile.start, tile.next_conn)) is not None:
-        return curve, end
-    if (end := _check_curve(np.fliplr(curve), tile.start, tile.next_conn)) is not None:
-        return np.fliplr(curve), end
-    if (end := _check_curve(np.flipud(curve), tile.start, tile.next_conn)) is not None:
-        return np.flipud(curve), end
-
-def construct_curve(tile: Tile) -> tuple[np.array, CornerPlace]:
-    _, curve = curves.generate_hilbert_mappings(tile.height, tile.width)
-    if (res := _check_ways(tile, curve)) is not None:
-        return res
-    if (res := _check_ways(tile, np.fliplr(curve))) is not None:
-        return res
-    if (res := _check_ways(tile, np.flipud(curve))) is not None:
-        return res
-    t_curve = _get_transposed_curve(tile.width, tile.height)
-    if (res := _check_ways(tile, t_curve)) is not None:
-        return res
-    if (res := _check_ways(tile, np.fliplr(t_curve))) is not None:
-        return res
-    if (res := _check_ways(tile, np.flipud(t_curve))) is not None:
-        return res
-    raise Exception(f"couldn't get matching sfcurve for {tile.width} {tile.height} {tile.start} {tile.next_conn}")
\ No newline at end of file
+def curve_positions(tile: Tile, mappings: typing.Optional[tuple[np.ndarray, np.ndarray]] = None) -> tuple[np.array, np.array]:
+    """
+    Rows and columns of the points of construct_curve(tile) in curve order, taken
+    from the cached (or given) index_to_xy instead of inverting the curve.
+    """
+    (transposed, lr, ud), _ = _tile_orientation(tile)
+    index_to_xy = (mappings if mappings is not None else tile_mappings(tile))[0]
+    if transposed:
+        cols, rows = index_to_xy.T
+    else:
+        rows, cols = index_to_xy.T
+    if lr:
+        cols = tile.width - 1 - cols
+    if ud:
+        rows = tile.height - 1 - rows
+    return rows, cols
@@ -1,29 +1,61 @@
 import numpy as np
-from matplotlib.collections import LineCollection
-import matplotlib.pyplot as plt
 
+from lib import profiling
+from lib.misc.draw_map import LINES_MAX_CELLS, colormap_lut, finish_figure, new_figure, raster_step
 
-def plot_mapping(N, M, curve, proc_map_2d, save_as: str):
+
+def render_grid_raster(N, M, curve, proc_map, max_side: int = 4096, cmap: str = 'rainbow') -> np.ndarray:
+    """
+    (M, N, 3) uint8 RGB image of the processor of every cell, x to the right and y up
+    as in plot_mapping, downsampled by taking every step-th cell beyond max_side.
+    """
+    grid = np.empty((N, M), dtype=np.asarray(proc_map).dtype)
+    grid[curve[:, 0], curve[:, 1]] = proc_map
+    step = raster_step(M, N, max_side)
+    lut = colormap_lut(int(grid.max()) + 1, cmap)
+    return lut[grid[::step, ::step].T[::-1]]
+
+
+@profiling.profiled('draw.plot_mapping', cells=lambda N, M, *args, **kwargs: N * M)
+def plot_mapping(N, M, curve, proc_map_2d, save_as: str, mode: str = 'auto', max_side: int = 4096):
+    """
+    Plots the curve through the N x M grid coloured by processor. mode='raster' paints
+    cells instead of drawing segments ('auto' does so above LINES_MAX_CELLS cells).
+    """
     assert N*M == len(curve)
+    if mode == 'auto':
+        mode = 'raster' if N * M > LINES_MAX_CELLS else 'lines'
+    if mode not in ('lines', 'raster'):
+        raise ValueError(f"unknown plot mode: {mode}")
+    fig = new_figure(figsize=(6.4, 4.8), dpi=100)
+    ax = fig.subplots()
+    if mode == 'raster':
+        ax.imshow(render_grid_raster(N, M, curve, proc_map_2d, max_side), extent=(-0.5, N - 0.5, -0.5, M - 0.5),
+                  interpolation='nearest')
+        finish_figure(fig, save_as, show=False)
+        return fig
+
+    from matplotlib import colormaps
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import Normalize
+
     segments = np.array([curve[:-1], curve[1:]]).transpose(1, 0, 2)
 
     segment_values = proc_map_2d[1:]
 
-    cmap = plt.get_cmap('rainbow')
+    cmap = colormaps['rainbow']
 
-    plt.figure(figsize=(7, 7))
-    norm = plt.Normalize(vmin=proc_map_2d.min(), vmax=proc_map_2d.max())
+    norm = Normalize(vmin=proc_map_2d.min(), vmax=proc_map_2d.max())
     segment_colors = cmap(norm(segment_values))
 
     lc = LineCollection(segments, colors=segment_colors)
 
-    fig, ax = plt.subplots()
     ax.add_collection(lc)
 
     ax.set_xlim(-1, N)
     ax.set_xticks(range(0, N + 1, 2 if N < 32 else 8))
     ax.set_yticks(range(0, M + 1, 2 if M < 32 else 8))
     ax.set_ylim(-1, M)
-    plt.gca().set_aspect('equal', adjustable='box')
-    plt.savefig(save_as)
-
+    ax.set_aspect('equal', adjustable='box')
+    finish_figure(fig, save_as, show=False)
+    return fig
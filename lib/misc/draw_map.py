@@ -1,14 +1,56 @@
 # lib/map/visualization.py
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.collections import LineCollection
-from matplotlib.patches import Rectangle
-from typing import Optional, Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
 from pathlib import Path
 
+from lib import profiling
+from lib.distribute import processors_of
 from lib.map.map import Map
 from lib.map.tile import NextConnect
 
+# matplotlib is only imported once something is drawn
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+
+def _tile_origins(tile_map: Map, sizes: list[tuple], margin) -> list[tuple]:
+    """
+    Lower left corners of the tiles (y pointing up), every tile placed next to the
+    previous one on its NextConnect side and aligned with the corner where the curve
+    leaves it. sizes are the (width, height) extents of the tiles in the same units.
+    """
+    origins = []
+    current_x, current_y = 0, 0
+    for t, tile in enumerate(tile_map.tiles):
+        width, height = sizes[t]
+        next_width, next_height = sizes[t + 1] if t + 1 < len(tile_map.tiles) else (0, 0)
+        origins.append((current_x, current_y))
+        if t == len(tile_map.tiles) - 1:
+            break
+
+        last = tile_map.tile_curves[t].max()
+        curve = tile_map.tile_curves[t]
+        next_conn = tile.next_conn
+        if next_conn == NextConnect.RIGHT:
+            current_x += width + margin
+            if curve[0, -1] == last:
+                current_y += height - next_height
+        elif next_conn == NextConnect.LEFT:
+            current_x -= next_width + margin
+            if curve[0, 0] == last:
+                current_y += height - next_height
+        elif next_conn == NextConnect.TOP:
+            current_y += height + margin
+            if curve[0, -1] == last:
+                current_x += width - next_width
+        elif next_conn == NextConnect.BOTTOM:
+            current_y -= next_height + margin
+            if curve[-1, -1] == last:
+                current_x += width - next_width
+    return origins
+
 
 def calculate_tile_positions(tile_map: Map) -> Tuple[np.ndarray, dict]:
     """
@@ -17,92 +59,167 @@ def calculate_tile_positions(tile_map: Map) -> Tuple[np.ndarray, dict]:
         - base_coords: Array of (x,y) coordinates for each point in the map
         - tile_rects: Dict of {tile_index: (x, y, width, height)}
     """
-    tile_positions = {}
-    tile_rects = {}
-    current_x, current_y = 0, 0
+    sizes = [(tile.width - 1, tile.height - 1) for tile in tile_map.tiles]
+    origins = _tile_origins(tile_map, sizes, margin=0.2)
+    tile_rects = {t: (x, y, w, h) for t, ((x, y), (w, h)) in enumerate(zip(origins, sizes))}
 
+    # Create coordinate mapping for all points, tile by tile through the index tables
+    origins = np.array(origins, dtype=float)
+    heights = np.array([tile.height for tile in tile_map.tiles])
+    base_coords = np.empty((tile_map.get_total_n(), 2))
+    base_coords[:, 0] = origins[tile_map.ind_t, 0] + tile_map.ind_x
+    base_coords[:, 1] = origins[tile_map.ind_t, 1] + (heights[tile_map.ind_t] - 1 - tile_map.ind_y)
 
-    for t, tile in enumerate(tile_map.tiles):
-        # n = tile.n-1
-        width = tile.width-1
-        height = tile.height-1
-        next_width = tile_map.tiles[t+1].width -1  if t+1 < len(tile_map.tiles)  else 0
-        next_height = tile_map.tiles[t+1].height -1  if t+1 < len(tile_map.tiles)  else 0
-        # Store tile position and dimensions
-        tile_positions[t] = (current_x, current_y)
-        tile_rects[t] = (current_x, current_y, width, height)
-
-        TILE_MARGIN = 0.2
-
-        # Calculate position for next tile based on connection
-        if t < len(tile_map.tiles) - 1:
-            next_conn = tile.next_conn
-            if next_conn == NextConnect.RIGHT:
-                current_x += width + TILE_MARGIN
-                if tile_map.get_ind(t, 0, width) == tile_map.tile_curves[t].max():
-                    current_y += height - next_height
-            elif next_conn == NextConnect.LEFT:
-                current_x -= next_width + TILE_MARGIN
-                if tile_map.get_ind(t, 0, 0) == tile_map.tile_curves[t].max():
-                    current_y += height - next_height
-            elif next_conn == NextConnect.TOP:
-                current_y += height + TILE_MARGIN
-                if tile_map.get_ind(t, 0, width) == tile_map.tile_curves[t].max():
-                    current_x += width - next_width
-            elif next_conn == NextConnect.BOTTOM:
-                current_y -= next_height + TILE_MARGIN
-                if tile_map.get_ind(t, height, width) == tile_map.tile_curves[t].max():
-                    current_x += width - next_width
-
-    # Create coordinate mapping for all points
-    base_coords = np.zeros((tile_map.get_total_n(), 2))
+    return base_coords, tile_rects
+
+
+def colormap_lut(n_colors: int, cmap: str = 'rainbow') -> np.ndarray:
+    """(n_colors, 3) uint8 RGB table sampling the colormap evenly, like Normalize over 0..n_colors-1."""
+    from matplotlib import colormaps
+    return (colormaps[cmap](np.linspace(0, 1, max(n_colors, 1)))[:, :3] * 255).astype(np.uint8)
+
+
+def raster_step(height: int, width: int, max_side: int) -> int:
+    """Downsampling step that fits a height x width image into max_side pixels per side."""
+    return max(1, -(-max(height, width) // max_side))
+
+
+def render_map_raster(tile_map: Map, proc_mapping: Optional[np.ndarray] = None, max_side: int = 4096, margin: int = 0,
+                      cmap: str = 'rainbow', background=(255, 255, 255),
+                      ranges: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Paints the processor of every cell straight into an (H, W, 3) uint8 RGB image,
+    one pixel per cell, with the tiles laid out as in visualize_map (margin cells
+    between them). Images larger than max_side are downsampled by taking every
+    step-th cell, so only the pixels that are drawn get looked up. The processors come
+    from proc_mapping or, without an N-length array, from the (N_p, 2) ranges.
+    """
+    sizes = [(tile.width, tile.height) for tile in tile_map.tiles]
+    origins = np.array(_tile_origins(tile_map, sizes, margin), dtype=np.int64)
+    sizes = np.array(sizes, dtype=np.int64)
+    # image rows grow downwards
+    left = origins[:, 0] - origins[:, 0].min()
+    top = (origins[:, 1] + sizes[:, 1]).max() - (origins[:, 1] + sizes[:, 1])
+    width, height = (left + sizes[:, 0]).max(), (top + sizes[:, 1]).max()
+
+    step = raster_step(height, width, max_side)
+    image = np.empty((-(-height // step), -(-width // step), 3), dtype=np.uint8)
+    image[:] = background
+    lut = colormap_lut(_processor_count(proc_mapping, ranges), cmap)
     for t, curve in enumerate(tile_map.tile_curves):
-        tile_x, tile_y = tile_positions[t]
-        width = tile_map.tiles[t].width
-        height = tile_map.tiles[t].height
-        for x in range(width):
-            for y in range(height):
-                hilbert_idx = curve[y, x]
-                base_coords[hilbert_idx] = [tile_x + x, tile_y + (height-1 - y)]
+        # the first sampled row/column of the tile sits on the global step grid
+        row0, col0 = -top[t] % step, -left[t] % step
+        cells = curve[row0::step, col0::step]
+        r, c = (top[t] + row0) // step, (left[t] + col0) // step
+        image[r:r + cells.shape[0], c:c + cells.shape[1]] = lut[processors_of(cells, proc_mapping, ranges)]
+    return image
+
+
+def _processor_count(proc_mapping: Optional[np.ndarray], ranges: Optional[np.ndarray]) -> int:
+    return len(ranges) if ranges is not None else int(np.max(proc_mapping)) + 1
+
+
+def _used_processors(proc_mapping: Optional[np.ndarray], ranges: Optional[np.ndarray]) -> int:
+    if ranges is not None:
+        return int(np.count_nonzero(ranges[:, 1] > ranges[:, 0]))
+    return np.unique(proc_mapping).size
+
+
+def new_figure(figsize: Tuple[float, float], dpi: int, show: bool = False) -> 'Figure':
+    """
+    Figure on an Agg canvas, not registered with pyplot, so it is freed with its last
+    reference and can be drawn from any thread. Only figures that are going to be
+    shown go through pyplot.
+    """
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure(figsize=figsize, dpi=dpi)
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def finish_figure(fig: 'Figure', save_as: Optional[str], show: bool, **savefig_kwargs):
+    """Saves the figure if save_as is given, then shows and closes it if it came from pyplot."""
+    if save_as:
+        Path(save_as).parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(save_as, **savefig_kwargs)
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+        plt.close(fig)
 
-    return base_coords, tile_rects
 
+def save_raster(image: np.ndarray, path: str):
+    """Writes an RGB image array as PNG."""
+    from matplotlib.image import imsave
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    imsave(path, image)
 
+
+# above this many cells the per-segment line plot gets too slow
+LINES_MAX_CELLS = 256 * 256
+
+
+@profiling.profiled('draw.visualize_map', cells=lambda tile_map, *args, **kwargs: tile_map.get_total_n())
 def visualize_map(tile_map: Map,
-                  proc_mapping: np.array,
+                  proc_mapping: Optional[np.array] = None,
                   save_as: Optional[str] = None,
-                  show: bool = True,
+                  show: bool = False,
                   dpi: int = 100,
                   linewidth: float = 1.5,
-                  figsize: Tuple[int, int] = (10, 10)) -> plt.Figure:
+                  figsize: Tuple[int, int] = (10, 10),
+                  mode: str = 'auto',
+                  max_side: int = 4096,
+                  ranges: Optional[np.ndarray] = None) -> 'Figure':
     """
     Visualization of the complete Hilbert curve across all tiles.
+    mode='lines' draws the curve segment by segment, mode='raster' paints the processor
+    of every cell into an image (render_map_raster), which stays fast for maps with
+    millions of cells; 'auto' switches to raster above LINES_MAX_CELLS cells.
 
     Args:
         tile_map: Initialized Map object
         proc_mapping: Mapping of hilbert index to processor
         save_as: Path to save the visualization
-        show: Whether to display the plot
+        show: Whether to display the plot (through pyplot, blocks until it is closed)
         dpi: Image resolution
         linewidth: Width of curve lines
         figsize: Figure dimensions in inches
+        mode: 'lines', 'raster' or 'auto'
+        max_side: largest raster image side in pixels, bigger maps are downsampled
+        ranges: (N_p, 2) [start, end) curve indices per processor, used instead of proc_mapping
 
     Returns:
         matplotlib Figure object
     """
+    if mode == 'auto':
+        mode = 'raster' if tile_map.get_total_n() > LINES_MAX_CELLS else 'lines'
+    if mode == 'raster':
+        return _visualize_map_raster(tile_map, proc_mapping, ranges, save_as, show, dpi, figsize, max_side)
+    if mode != 'lines':
+        raise ValueError(f"unknown visualization mode: {mode}")
+
     # Calculate proper tile positions
     base_coords, tile_rects = calculate_tile_positions(tile_map)
 
+    from matplotlib import colormaps
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import Normalize
+    from matplotlib.patches import Rectangle
+
     # Create line segments for the entire curve
     segments = np.array([base_coords[:-1], base_coords[1:]]).transpose(1, 0, 2)
-    segment_values = proc_mapping[1:]
-    cmap = plt.get_cmap('rainbow')
-    plt.figure(figsize=(7, 7))
-    norm = plt.Normalize(vmin=segment_values.min(), vmax=segment_values.max())
+    segment_values = processors_of(np.arange(1, tile_map.get_total_n()), proc_mapping, ranges)
+    cmap = colormaps['rainbow']
+    norm = Normalize(vmin=segment_values.min(), vmax=segment_values.max())
     segment_colors = cmap(norm(segment_values))
 
     # Create figure
-    fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    fig = new_figure(figsize, dpi, show)
+    ax = fig.subplots()
     lc = LineCollection(segments, linewidth=linewidth, colors=segment_colors)
     ax.add_collection(lc)
 
@@ -122,14 +239,52 @@ def visualize_map(tile_map: Map,
     ax.set_xlim(min_x - 1, max_x + 1)
     ax.set_ylim(min_y - 1, max_y + 1)
     ax.set_aspect('equal')
-    plt.xticks([])
-    plt.yticks([])
-    ax.set_title(f'Hilbert Curve Across Tiles, N = {tile_map.get_total_n()}, N_p = {np.unique(proc_mapping).size}', pad=20)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(f'Hilbert Curve Across Tiles, N = {tile_map.get_total_n()}, N_p = {_used_processors(proc_mapping, ranges)}', pad=20)
+
+    finish_figure(fig, save_as, show, bbox_inches='tight', dpi=dpi)
+    return fig
 
-    if save_as:
-        Path(save_as).parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(save_as, bbox_inches='tight', dpi=dpi)
-    if show:
-        plt.show()
 
+def _visualize_map_raster(tile_map: Map, proc_mapping: Optional[np.ndarray], ranges: Optional[np.ndarray], save_as: Optional[str], show: bool,
+                          dpi: int, figsize: Tuple[int, int], max_side: int) -> 'Figure':
+    image = render_map_raster(tile_map, proc_mapping, max_side=max_side, ranges=ranges)
+    fig = new_figure(figsize, dpi, show)
+    ax = fig.subplots()
+    ax.imshow(image, interpolation='nearest')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(f'Hilbert Curve Across Tiles, N = {tile_map.get_total_n()}, N_p = {_used_processors(proc_mapping, ranges)}', pad=20)
+    finish_figure(fig, save_as, show, bbox_inches='tight', dpi=dpi)
     return fig
+
+
+# map shared by the tasks of one render_partitions call in a worker process
+_worker_map: Optional[Map] = None
+
+
+def _set_worker_map(tile_map: Map):
+    global _worker_map
+    _worker_map = tile_map
+
+
+def _render_partition(tile_map: Optional[Map], proc_mapping: np.ndarray, path: str, options: dict) -> str:
+    visualize_map(tile_map if tile_map is not None else _worker_map, proc_mapping, save_as=path, show=False, **options)
+    return path
+
+
+def render_partitions(tile_map: Map, proc_mappings: list[np.ndarray], paths: list[str],
+                      workers: Optional[int] = None, threads: bool = False, **options) -> list[str]:
+    """
+    Writes visualize_map images of several partitions of the same map concurrently,
+    proc_mappings[i] into paths[i]. Figures are headless and independent, so they are
+    drawn in a process pool (the map is sent once per process) or, with threads, in
+    a thread pool, which avoids copying the map but shares the GIL while drawing.
+    options are passed on to visualize_map (mode, dpi, figsize, ...).
+    """
+    if threads:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_render_partition, repeat(tile_map), proc_mappings, paths, repeat(options)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_map, initargs=(tile_map,)) as pool:
+        return list(pool.map(_render_partition, repeat(None), proc_mappings, paths, repeat(options)))
@@ -1,19 +1,98 @@
+import shutil
+import tempfile
+import zipfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterator, Optional
+
 import numpy
 import numpy as np
 
+from lib import profiling
+from lib.distribute import processors_of
 from lib.map.map import Map
 
+# cells converted to text (or bytes) at once, bounds the memory used by save_map
+_CHUNK_CELLS = 1 << 18
+
 
+@profiling.profiled('export.save_array', cells=lambda a, path: np.size(a))
 def save_array(a, path):
     numpy.savetxt(path, a.astype(int), fmt='%u', header="t,y,x,p")
 
-def save_map(map: Map, path: str):
-    tyx = []
-    for t in range(len(map.tile_curves)):
-        print(t, map.tiles[t], map.tile_curves[t].shape)
-        print(map.tile_curves[t])
-        for y in range(map.tiles[t].height):
-            for x in range(map.tiles[t].width):
-                tyx.append([t, y, x])
-    arr = np.array([[t, y, x, map.get_ind(t, y, x)] for t, y, x in tyx], dtype=int)
-    save_array(arr, path)
\ No newline at end of file
+
+def _map_chunks(map: Map, proc_mapping: Optional[np.ndarray], ranges: Optional[np.ndarray],
+                chunk_cells: int) -> Iterator[list[np.ndarray]]:
+    """Yields the t, y, x, i (and p) columns of the map, tile by tile, in blocks of whole rows."""
+    for t, curve in enumerate(map.tile_curves):
+        height, width = curve.shape
+        rows = max(1, chunk_cells // width)
+        for y0 in range(0, height, rows):
+            ind = np.ravel(curve[y0:y0 + rows])
+            ys, xs = np.meshgrid(np.arange(y0, y0 + len(ind) // width), np.arange(width), indexing='ij')
+            columns = [np.full(len(ind), t), ys.ravel(), xs.ravel(), ind]
+            if proc_mapping is not None or ranges is not None:
+                columns.append(processors_of(ind, proc_mapping, ranges))
+            yield columns
+
+
+def _save_npz(map: Map, path: str, names: list[str], proc_mapping: Optional[np.ndarray],
+              ranges: Optional[np.ndarray], chunk_cells: int):
+    """
+    Compressed archive with one .npy array per column. A zip file takes one writer at
+    a time, so the columns are spooled into raw temporary files in a single pass over
+    the map and then compressed into the archive one after another.
+    """
+    with tempfile.TemporaryDirectory(dir=Path(path).parent) as tmp, ExitStack() as stack:
+        parts = [stack.enter_context(open(Path(tmp) / name, 'w+b')) for name in names]
+        for columns in _map_chunks(map, proc_mapping, ranges, chunk_cells):
+            for part, column in zip(parts, columns):
+                part.write(column.astype('<i4').tobytes())
+
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, part in zip(names, parts):
+                part.seek(0)
+                with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array_header_1_0(
+                        f, {'descr': '<i4', 'fortran_order': False, 'shape': (map.get_total_n(),)})
+                    shutil.copyfileobj(part, f, 4 * chunk_cells)
+
+
+@profiling.profiled('export.save_map', cells=lambda map, *args, **kwargs: map.get_total_n())
+def save_map(map: Map, path: str, proc_mapping: Optional[np.ndarray] = None,
+             compressed: bool = False, chunk_cells: int = _CHUNK_CELLS, ranges: Optional[np.ndarray] = None):
+    """
+    Writes every cell of the map as tile, row, column and curve index (t, y, x, i)
+    and, when proc_mapping or ranges is given, its processor (p). The map is streamed tile by
+    tile in chunks of about chunk_cells cells, so memory use doesn't grow with it.
+
+    Args:
+        map: Map to export
+        path: output file
+        proc_mapping: processor of every curve index, adds the p column
+        compressed: write a compressed .npz archive with one int32 array per column
+            (read it with numpy.load) instead of text in the save_array format
+        chunk_cells: number of cells converted at once
+        ranges: (N_p, 2) [start, end) curve indices per processor, used instead of
+            proc_mapping, the processors of every chunk are looked up in them
+    """
+    if proc_mapping is not None and ranges is not None:
+        raise ValueError('give either proc_mapping or ranges, not both')
+    names = ['t', 'y', 'x', 'i'] + (['p'] if proc_mapping is not None or ranges is not None else [])
+    if proc_mapping is not None:
+        proc_mapping = np.asarray(proc_mapping)
+        if len(proc_mapping) != map.get_total_n():
+            raise ValueError(f"proc_mapping has {len(proc_mapping)} entries, map has {map.get_total_n()} points")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    if compressed:
+        _save_npz(map, path, names, proc_mapping, ranges, chunk_cells)
+        return
+
+    row_format = ' '.join(['%u'] * len(names)) + '\n'
+    with open(path, 'w') as f:
+        f.write('# ' + ','.join(names) + '\n')
+        for columns in _map_chunks(map, proc_mapping, ranges, chunk_cells):
+            block = np.stack(columns, axis=1)
+            # one %-format over the whole block is several times faster than savetxt's per-row loop
+            f.write((row_format * len(block)) % tuple(block.ravel().tolist()))
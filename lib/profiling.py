@@ -0,0 +1,233 @@
+"""
+Lightweight instrumentation of the partitioning pipeline: per-stage wall time,
+processed cells, peak RSS and counters (e.g. curve cache hits).
+
+Profiling is off by default, and then stage() returns a shared no-op object and
+profiled functions cost one flag check. Enable it with the SFC_PROFILE environment
+variable (1, or 'alloc' to also trace numpy/Python allocations with tracemalloc) or
+with enable(). When enabled, a report is printed to stderr at exit, and written as
+JSON into the file named by SFC_PROFILE_OUTPUT if it is set.
+
+Stages may be timed from several threads, every thread nests its own stages. The
+tracemalloc peak is process-wide though, so allocation peaks of stages running at
+the same time include each other.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+ENV_VAR = 'SFC_PROFILE'
+OUTPUT_ENV_VAR = 'SFC_PROFILE_OUTPUT'
+
+_enabled = False
+_allocations = False
+_output: Optional[str] = None
+_atexit_registered = False
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    cells: int = 0
+    peak_rss_mb: float = 0.0
+    peak_alloc_mb: float = 0.0
+
+
+_stages: dict[str, StageStats] = {}
+_counters: dict[str, int] = {}
+# guards _stages and _counters, stages may run in several threads (e.g. render_partitions)
+_lock = threading.Lock()
+# stages open in the current thread, innermost last
+_local = threading.local()
+
+
+def _open_stages() -> list['_Stage']:
+    if not hasattr(_local, 'stages'):
+        _local.stages = []
+    return _local.stages
+
+
+def peak_rss_mb() -> float:
+    """
+    High-water mark of the resident set size of this process, it never goes down.
+    0 where the resource module isn't available (Windows).
+    """
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+class _Stage:
+    def __init__(self, name: str, cells: int):
+        self.name = name
+        self.cells = cells
+        self.child_peak = 0
+
+    def add_cells(self, cells: int):
+        self.cells += cells
+
+    def __enter__(self):
+        open_stages = _open_stages()
+        if _allocations:
+            # nested stages reset the peak, their peaks are passed up in child_peak
+            if open_stages:
+                parent = open_stages[-1]
+                parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        open_stages.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        open_stages = _open_stages()
+        open_stages.pop()
+        rss = peak_rss_mb()
+        peak = max(self.child_peak, tracemalloc.get_traced_memory()[1]) if _allocations else 0
+        with _lock:
+            stats = _stages.setdefault(self.name, StageStats())
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.cells += self.cells
+            stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+            stats.peak_alloc_mb = max(stats.peak_alloc_mb, peak / 2**20)
+        if _allocations and open_stages:
+            open_stages[-1].child_peak = max(open_stages[-1].child_peak, peak)
+
+
+class _NoStage:
+    def add_cells(self, cells: int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str, cells: int = 0):
+    """
+    Context manager timing a stage of the pipeline, e.g.
+
+        with profiling.stage('map.build', cells=total_n):
+            ...
+
+    Cells found out inside the stage can be added with add_cells on the returned object.
+    """
+    return _Stage(name, cells) if _enabled else _NO_STAGE
+
+
+def profiled(name: str, cells: Optional[Callable[..., int]] = None):
+    """
+    Decorator timing every call of the function as stage name. cells, if given, is
+    called with the same arguments and returns the number of cells the call processes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name, cells(*args, **kwargs) if cells else 0):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    """Adds n to the counter name."""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(allocations: bool = False, output: Optional[str] = None, report_at_exit: bool = True):
+    """
+    Turns profiling on. allocations also traces allocations with tracemalloc (which
+    slows down allocation-heavy code); output is a JSON file written at exit.
+    """
+    global _enabled, _allocations, _output, _atexit_registered
+    _enabled = True
+    _allocations = allocations
+    _output = output
+    if allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if report_at_exit and not _atexit_registered:
+        atexit.register(_report_at_exit)
+        _atexit_registered = True
+
+
+def disable():
+    global _enabled, _allocations
+    _enabled = False
+    if _allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _allocations = False
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def report() -> dict:
+    """Collected stages and counters, stage times are totals over all calls."""
+    with _lock:
+        stages = {name: asdict(stats) for name, stats in _stages.items()}
+        counters = dict(_counters)
+    return {'stages': stages, 'counters': counters, 'peak_rss_mb': peak_rss_mb()}
+
+
+def format_report(data: Optional[dict] = None) -> str:
+    data = report() if data is None else data
+    allocations = any(stats['peak_alloc_mb'] for stats in data['stages'].values())
+    lines = [f"{'stage':<32} {'calls':>6} {'wall s':>9} {'cells':>12} {'cells/s':>12} {'peak RSS MB':>12}"
+             + (f" {'peak alloc MB':>14}" if allocations else '')]
+    for name, stats in sorted(data['stages'].items(), key=lambda item: -item[1]['seconds']):
+        rate = f"{stats['cells'] / stats['seconds']:.3g}" if stats['cells'] and stats['seconds'] else '-'
+        line = (f"{name:<32} {stats['calls']:>6} {stats['seconds']:>9.3f} {stats['cells']:>12} {rate:>12}"
+                f" {stats['peak_rss_mb']:>12.1f}")
+        if allocations:
+            line += f" {stats['peak_alloc_mb']:>14.1f}"
+        lines.append(line)
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"{name:<32} {value:>6}")
+    lines.append(f"peak RSS {data['peak_rss_mb']:.1f} MB")
+    return '\n'.join(lines)
+
+
+def _report_at_exit():
+    if not _stages and not _counters:
+        return
+    data = report()
+    print(format_report(data), file=sys.stderr)
+    if _output:
+        with open(_output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+if os.environ.get(ENV_VAR, '') not in ('', '0'):
+    enable(allocations=os.environ[ENV_VAR] == 'alloc', output=os.environ.get(OUTPUT_ENV_VAR))
@@ -1,41 +1,166 @@
-import math
-import sys
+"""
+Partitioning CLI. Heavy modules (matplotlib, the exporters, the metrics) are only
+imported by the subcommands that need them, so a partition-only run starts fast.
 
-import numpy as np
+    python3 main.py partition <config> [-p N_p] [-o output/map.sfc]
+    python3 main.py export output/map.sfc [-o output/mapping.csv] [--compressed]
+    python3 main.py render output/map.sfc [-o output/hilbert_map.png] [--mode raster]
+    python3 main.py metrics output/map.sfc [--json]
+    python3 main.py <config>    # partition, export to output/mapping.csv and render output/hilbert_map.png
+"""
+import argparse
+import sys
 
-from lib import distribute
-from lib import curves
-from lib.map.loader import load_tile_dtos
-from lib.map.map import Map
-from lib.misc import draw
-from lib.misc import export
-from lib.misc.draw_map import visualize_map
-from lib.misc.export import save_array, save_map
+COMMANDS = ('partition', 'export', 'render', 'metrics')
 
 
-def main(config_path: str):
-    tile_dtos = load_tile_dtos(config_path)
-    # for t in tile_dtos:
-    #     if t.width != t.height:
-    #         raise NotImplementedError("handling Map with non-square Tiles is not implemented")
+def build(config_path: str, N_p: int = 8):
+    """Builds the map from the config and splits it for N_p processors, in memory."""
+    from lib import distribute
+    from lib import profiling
+    from lib.map.loader import load_tile_dtos
+    from lib.map.map import Map
 
+    with profiling.stage('main.load_config'):
+        tile_dtos = load_tile_dtos(config_path)
     tile_map = Map(tile_dtos)
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), N_p)
+    return tile_map, proc_mapping
+
+
+def partition(config_path: str, N_p: int = 8, output: str = "output/map.sfc"):
+    """build, then writes the map and the mapping into a map file."""
+    from lib.map.mapfile import save_map_file
+
+    tile_map, proc_mapping = build(config_path, N_p)
+    save_map_file(tile_map, output, proc_mapping)
+    return tile_map, proc_mapping
+
+
+def _load(map_path: str):
+    from lib.map.mapfile import load_map_file
+
+    tile_map = load_map_file(map_path)
+    if tile_map.proc_mapping is None:
+        raise ValueError(f"{map_path} has no processor mapping, write it with 'partition'")
+    return tile_map, tile_map.proc_mapping
+
+
+def export(map_path: str, output: str = "output/mapping.csv", compressed: bool = False):
+    from lib.misc.export import save_map
+
+    tile_map, proc_mapping = _load(map_path)
+    save_map(tile_map, output, proc_mapping, compressed=compressed)
+
+
+def render(map_path: str, output: str = "output/hilbert_map.png", mode: str = 'auto', show: bool = False):
+    from lib.misc.draw_map import visualize_map
+
+    tile_map, proc_mapping = _load(map_path)
+    visualize_map(tile_map,
+                  proc_mapping,
+                  save_as=output,
+                  show=show,
+                  linewidth=2.0,
+                  figsize=(12, 8),
+                  mode=mode)
+
+
+def metrics(map_path: str) -> dict:
+    """Load balance and communication cost of the partition in a map file."""
+    import numpy as np
+    from benchmark.perimeter_sum import get_communication_metrics, get_perimeter_sum
+    from lib import distribute
+
+    tile_map, proc_mapping = _load(map_path)
+    try:
+        ranges = distribute.mapping_to_ranges(proc_mapping)
+        partition = {'ranges': ranges}
+        loads = distribute.range_loads(ranges)
+    except ValueError:
+        # processors owning several chunks of the curve, e.g. after refinement by hand
+        partition = {'proc_mapping': proc_mapping}
+        loads = np.bincount(proc_mapping)
+    communication = get_communication_metrics(tile_map, **partition)
+    return {
+        'points': tile_map.get_total_n(),
+        'processors': len(loads),
+        'imbalance': distribute.load_imbalance(loads),
+        'edge_cut': communication.edge_cut,
+        'max_halo_volume': int(communication.halo_volume.max()),
+        'max_neighbour_ranks': int(communication.neighbour_ranks.max()),
+        'perimeter_sum': get_perimeter_sum(tile_map, **partition),
+    }
+
+
+def main(config_path: str):
+    """The original all-in-one run: partition for 8 processors, export and render."""
+    from lib.misc.draw_map import visualize_map
+    from lib.misc.export import save_map
 
-    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 8)
+    tile_map, proc_mapping = build(config_path, 8)
 
-    save_map(tile_map, "output/mapping.csv")
+    save_map(tile_map, "output/mapping.csv", proc_mapping)
 
     visualize_map(tile_map,
                   proc_mapping,
                   save_as="output/hilbert_map.png",
-                  show=True,
                   linewidth=2.0,
                   figsize=(12, 8))
 
+
+def cli(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('partition', help='build the map and split it, write a map file')
+    p.add_argument('config', help='json tile config')
+    p.add_argument('-p', '--processors', type=int, default=8, help='number of processors')
+    p.add_argument('-o', '--output', default="output/map.sfc")
+
+    p = commands.add_parser('export', help='write a map file as a csv (or npz) mapping')
+    p.add_argument('map', help='map file written by partition')
+    p.add_argument('-o', '--output', default="output/mapping.csv")
+    p.add_argument('--compressed', action='store_true', help='write a compressed npz archive')
+
+    p = commands.add_parser('render', help='draw the partition of a map file')
+    p.add_argument('map', help='map file written by partition')
+    p.add_argument('-o', '--output', default="output/hilbert_map.png")
+    p.add_argument('--mode', default='auto', choices=['auto', 'lines', 'raster'])
+    p.add_argument('--show', action='store_true', help='also open a window')
+
+    p = commands.add_parser('metrics', help='print load balance and communication metrics of a map file')
+    p.add_argument('map', help='map file written by partition')
+    p.add_argument('--json', action='store_true')
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case 'partition':
+            partition(args.config, args.processors, args.output)
+            print(f"Saved map and mapping into '{args.output}'")
+        case 'export':
+            export(args.map, args.output, args.compressed)
+            print(f"Saved mapping into '{args.output}'")
+        case 'render':
+            render(args.map, args.output, args.mode, args.show)
+            print(f"Saved image into '{args.output}'")
+        case 'metrics':
+            result = metrics(args.map)
+            if args.json:
+                import json
+                print(json.dumps(result))
+            else:
+                for name, value in result.items():
+                    print(f"{name}: {value}")
+
+
 if __name__ == '__main__':
-    if len(sys.argv) == 2:
-        cfg_path = sys.argv[1]
-        print(f"Running with config_path = {cfg_path}")
+    if len(sys.argv) >= 2 and (sys.argv[1] in COMMANDS or sys.argv[1].startswith('-')):
+        cli(sys.argv[1:])
     else:
-        cfg_path = input("Path to json config: ")
-    main(cfg_path)
\ No newline at end of file
+        if len(sys.argv) == 2:
+            cfg_path = sys.argv[1]
+            print(f"Running with config_path = {cfg_path}")
+        else:
+            cfg_path = input("Path to json config: ")
+        main(cfg_path)
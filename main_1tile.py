@@ -1,44 +1,198 @@
-import math
+"""
+Partitions a single N x M rectangle along a space-filling curve.
+
+    python3 main_1tile.py N M N_p [--curve gilbert]
+    python3 main_1tile.py --sweep --sizes 64 128x96 --procs 4 8 16:64:16 [--workers 4] [-o output/sweep]
+
+The sweep partitions every size for every processor count (and every --cases N,M,N_p
+triple), generating each distinct curve once, and writes the mappings together with
+a summary table (summary.csv) of the imbalance and the perimeters of the partitions.
+Processor ranges start:stop[:step] include stop.
+"""
+import argparse
+import csv
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
 
 import numpy as np
 
+from benchmark.perimeter_sum import calculate_perimeters
 from lib import distribute
 from lib import curves
-from lib.misc import draw
+from lib import profiling
 from lib.misc import export
 
 
-def pipeline(N, M, N_p):
-    curve, xy_to_index = curves.generate_hilbert_mappings(N, M)
+def split_grid(xy_to_index, N_p):
+    """Ranges of the curve for N_p processors, the processor of every curve index and of every cell."""
+    ranges = distribute.split_into_ranges(np.size(xy_to_index), N_p)
+    proc_map = distribute.ranges_to_mapping(ranges)
+    return ranges, proc_map, np.take(proc_map, xy_to_index)
+
+
+@profiling.profiled('main_1tile.pipeline', cells=lambda N, M, *args, **kwargs: N * M)
+def pipeline(N, M, N_p, curve_name='gilbert'):
+    curve, xy_to_index = curves.curve_mappings(curve_name, N, M)
     assert(len(curve) == N*M)
 
-    proc_map = distribute.split_into_processors(N * M, N_p)
-    proc_2d_arr = np.take(proc_map, xy_to_index)
+    _, proc_map, proc_2d_arr = split_grid(xy_to_index, N_p)
     return curve, proc_map, proc_2d_arr
 
-def main(N, M, N_p):
-    curve, proc_map_2d, proc_2d_arr = pipeline(N, M, N_p)
+def main(N, M, N_p, curve_name='gilbert'):
+    from lib.misc import draw
+
+    curve, proc_map_2d, proc_2d_arr = pipeline(N, M, N_p, curve_name)
 
     csv_path = f"output/hilbert_{N}x{M}_into_{N_p}.csv"
     export.save_array(proc_2d_arr, csv_path)
     print(f"Saved mapping into '{csv_path}'")
 
-    if N > 256:
-        return
-
     img_path = f"output/hilbert_{N}x{M}_into_{N_p}.png"
     draw.plot_mapping(N, M, curve, proc_map_2d, save_as=img_path)
     print(f"Saved image into '{img_path}'")
 
-if __name__ == '__main__':
-    if len(sys.argv) == 3:
-        N = int(sys.argv[1])
-        M = int(sys.argv[2])
-        N_p = int(sys.argv[3])
-        print(f"Running with N = {N}, M = {M} and N_p = {N_p}")
+
+@dataclass
+class SweepRow:
+    N: int
+    M: int
+    N_p: int
+    curve: str
+    imbalance: float
+    perimeter_sum: int
+    max_perimeter: int
+    mapping: str
+
+
+def _sweep_shape(N: int, M: int, procs: list[int], curve_name: str, output: str, fmt: str) -> list[SweepRow]:
+    """Partitions one N x M rectangle for every processor count, the curve is built once."""
+    _, xy_to_index = curves.curve_mappings(curve_name, N, M)
+    rows = []
+    for N_p in procs:
+        ranges, _, proc_2d_arr = split_grid(xy_to_index, N_p)
+        path = str(Path(output) / f"{curve_name}_{N}x{M}_into_{N_p}.{fmt}")
+        if fmt == 'npy':
+            np.save(path, proc_2d_arr.astype(np.int32))
+        else:
+            export.save_array(proc_2d_arr, path)
+        total, per_processor = calculate_perimeters(proc_2d_arr)
+        rows.append(SweepRow(N, M, N_p, curve_name, distribute.imbalance(ranges), total,
+                             int(per_processor.max()), path))
+    return rows
+
+
+def sweep(cases: list[tuple[int, int, int]], curve_name: str = 'gilbert', output: str = "output/sweep",
+          workers: int | None = None, fmt: str = 'csv') -> list[SweepRow]:
+    """
+    Partitions every (N, M, N_p) case, writes the mappings into output and the summary
+    table into output/summary.csv. Cases of the same rectangle go to one worker, so every
+    distinct curve is generated once; rectangles run in a pool of workers processes
+    (in this process if workers is 1). Rows come back in the order of the cases.
+    """
+    if fmt not in ('csv', 'npy'):
+        raise ValueError(f"unknown mapping format: {fmt}")
+    Path(output).mkdir(parents=True, exist_ok=True)
+    shapes: dict[tuple[int, int], list[int]] = {}
+    for N, M, N_p in cases:
+        procs = shapes.setdefault((N, M), [])
+        if N_p not in procs:
+            procs.append(N_p)
+    # the largest rectangles first, so they don't end up last on a single worker
+    jobs = sorted(shapes.items(), key=lambda item: -item[0][0] * item[0][1])
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs) or 1)
+    if workers == 1:
+        results = [_sweep_shape(N, M, procs, curve_name, output, fmt) for (N, M), procs in jobs]
     else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_sweep_shape, N, M, procs, curve_name, output, fmt) for (N, M), procs in jobs]
+            results = [future.result() for future in futures]
+
+    found = {(row.N, row.M, row.N_p): row for rows in results for row in rows}
+    rows = list({case: found[case] for case in cases}.values())
+    write_summary(rows, Path(output) / "summary.csv")
+    return rows
+
+
+def write_summary(rows: list[SweepRow], path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[field.name for field in fields(SweepRow)])
+        writer.writeheader()
+        writer.writerows(asdict(row) for row in rows)
+
+
+def format_summary(rows: list[SweepRow]) -> str:
+    lines = [f"{'N':>6} {'M':>6} {'N_p':>6} {'imbalance':>10} {'perimeter':>10} {'max per proc':>12}"]
+    for row in rows:
+        lines.append(f"{row.N:>6} {row.M:>6} {row.N_p:>6} {row.imbalance:>10.4f} {row.perimeter_sum:>10}"
+                     f" {row.max_perimeter:>12}")
+    return '\n'.join(lines)
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    """'N' for a square or 'NxM'."""
+    N, _, M = value.lower().partition('x')
+    return int(N), int(M or N)
+
+
+def parse_procs(value: str) -> list[int]:
+    """A processor count or an inclusive range start:stop[:step]."""
+    if ':' not in value:
+        return [int(value)]
+    start, stop, step = (value.split(':') + ['1'])[:3]
+    return list(range(int(start), int(stop) + 1, int(step)))
+
+
+def parse_case(value: str) -> tuple[int, int, int]:
+    """'N,M,N_p'."""
+    N, M, N_p = map(int, value.split(','))
+    return N, M, N_p
+
+
+def cli(argv: list[str]):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('N', type=int, nargs='?', help='side 1 of the rectangle')
+    parser.add_argument('M', type=int, nargs='?', help='side 2 of the rectangle')
+    parser.add_argument('N_p', type=int, nargs='?', help='number of processors')
+    parser.add_argument('--curve', default='gilbert', choices=sorted(curves.CURVES))
+    parser.add_argument('--sweep', action='store_true', help='partition many (N, M, N_p) combinations')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[], help='N or NxM')
+    parser.add_argument('--procs', type=parse_procs, nargs='+', default=[], help='N_p or start:stop[:step]')
+    parser.add_argument('--cases', type=parse_case, nargs='+', default=[], help='N,M,N_p')
+    parser.add_argument('--workers', type=int, help='processes of the sweep (default: all cores)')
+    parser.add_argument('--format', default='csv', choices=['csv', 'npy'], help='format of the sweep mappings')
+    parser.add_argument('-o', '--output', default="output/sweep", help='directory of the sweep results')
+    args = parser.parse_args(argv)
+
+    given = [value for value in (args.N, args.M, args.N_p) if value is not None]
+    if args.sweep:
+        if given:
+            parser.error('--sweep takes the sizes from --sizes/--procs/--cases, not from N M N_p')
+        procs = [N_p for group in args.procs for N_p in group]
+        cases = [(N, M, N_p) for N, M in args.sizes for N_p in procs] + args.cases
+        if not cases:
+            parser.error('--sweep needs --sizes with --procs, or --cases')
+        rows = sweep(cases, args.curve, args.output, args.workers, args.format)
+        print(format_summary(rows))
+        print(f"Saved {len(rows)} mappings and the summary into '{args.output}'")
+        return
+
+    if args.sizes or args.procs or args.cases:
+        parser.error('--sizes, --procs and --cases need --sweep')
+    if len(given) == 3:
+        N, M, N_p = given
+        print(f"Running with N = {N}, M = {M} and N_p = {N_p}")
+    elif not given:
         N = int(input("Side 1 of the rectangle, N = "))
         M = int(input("Side 2 of the rectangle, M = "))
         N_p = int(input("Number of processors, N_p = "))
-    main(N, M, N_p)
\ No newline at end of file
+    else:
+        parser.error('give all of N, M and N_p')
+    main(N, M, N_p, args.curve)
+
+
+if __name__ == '__main__':
+    cli(sys.argv[1:])
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from benchmark import perimeter_sum
+from benchmark.plot_benchmark import pipeline
+
+
+def _bfs_perimeter(grid):
+    """Reference: count every cell side that faces another processor or the boundary"""
+    rows, cols = grid.shape
+    total = 0
+    for i in range(rows):
+        for j in range(cols):
+            for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                ni, nj = i + di, j + dj
+                if ni < 0 or ni >= rows or nj < 0 or nj >= cols or grid[ni, nj] != grid[i, j]:
+                    total += 1
+    return total
+
+
+@pytest.mark.parametrize("N,M,N_p", [(1, 1, 1), (1, 9, 3), (8, 8, 4), (20, 20, 13), (80, 80, 37)])
+def test_matches_reference_on_benchmark_inputs(N, M, N_p):
+    grid = pipeline(N, M, N_p)[2]
+    assert perimeter_sum.calculate_total_perimeter(grid) == _bfs_perimeter(grid)
+
+
+def test_per_processor_breakdown():
+    grid = np.array([[0, 0, 1],
+                     [0, 0, 1]])
+    total, per_processor = perimeter_sum.calculate_perimeters(grid)
+    assert per_processor.tolist() == [8, 6]
+    assert total == 14
+
+
+def test_empty_grid():
+    assert perimeter_sum.calculate_total_perimeter(np.zeros((0, 0), dtype=int)) == 0
+
+
+def test_communication_metrics_across_seam():
+    from lib.map.map import Map, TileDTO, NextConnect
+
+    tile_map = Map([TileDTO(width=2, height=2, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=2, height=2, next_conn=NextConnect.BOTTOM)])
+    # one processor per tile: only the seam is cut
+    metrics = perimeter_sum.get_communication_metrics(tile_map, np.array([0] * 4 + [1] * 4))
+    assert metrics.edge_cut == 2
+    assert metrics.halo_volume.tolist() == [2, 2]
+    assert metrics.neighbour_ranks.tolist() == [1, 1]
+
+    # a single processor doesn't communicate, even though each tile has a perimeter
+    metrics = perimeter_sum.get_communication_metrics(tile_map, np.zeros(8, dtype=int))
+    assert metrics.edge_cut == 0
+    assert metrics.halo_volume.tolist() == [0]
+
+
+def test_communication_metrics_count_distinct_neighbours():
+    from lib import distribute
+    from lib.map.map import Map, TileDTO, NextConnect
+
+    tile_map = Map([TileDTO(width=8, height=8, next_conn=NextConnect.RIGHT)])
+    proc_mapping = distribute.split_into_processors(64, 4)
+    metrics = perimeter_sum.get_communication_metrics(tile_map, proc_mapping)
+
+    grid = np.take(proc_mapping, tile_map.tile_curves[0])
+    total, _ = perimeter_sum.calculate_perimeters(grid)
+    assert metrics.edge_cut == (total - 4 * 8) // 2
+    assert np.all(metrics.neighbour_ranks >= 1)
+
+
+def test_metrics_from_ranges_match_mapping():
+    from lib import distribute
+    from lib.map.map import Map, TileDTO, NextConnect
+
+    tile_map = Map([TileDTO(width=6, height=4, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=4, height=4, next_conn=NextConnect.BOTTOM)])
+    ranges = distribute.split_into_ranges(tile_map.get_total_n(), 5)
+    proc_mapping = distribute.ranges_to_mapping(ranges)
+
+    from_ranges = perimeter_sum.get_communication_metrics(tile_map, ranges=ranges)
+    from_mapping = perimeter_sum.get_communication_metrics(tile_map, proc_mapping)
+    assert from_ranges.edge_cut == from_mapping.edge_cut
+    assert np.array_equal(from_ranges.halo_volume, from_mapping.halo_volume)
+    assert np.array_equal(from_ranges.neighbour_ranks, from_mapping.neighbour_ranks)
+
+    expected = sum(perimeter_sum.calculate_total_perimeter(np.take(proc_mapping, curve))
+                   for curve in tile_map.tile_curves)
+    assert perimeter_sum.get_perimeter_sum(tile_map, ranges) == expected
+
+
+def test_surface_area_of_3d_grid():
+    grid = np.zeros((4, 3, 2), dtype=int)
+    assert perimeter_sum.calculate_total_perimeter(grid) == 2 * (4 * 3 + 3 * 2 + 4 * 2)
+
+    grid[2:] = 1  # cut across the longest side adds two 3x2 faces
+    total, per_processor = perimeter_sum.calculate_perimeters(grid)
+    assert total == 2 * (4 * 3 + 3 * 2 + 4 * 2) + 2 * 3 * 2
+    assert per_processor.tolist() == [2 * (2 * 3 + 3 * 2 + 2 * 2)] * 2
+
+
+def test_level_perimeters_and_edge_cuts():
+    from lib import distribute
+    from lib.map.map import Map, TileDTO, NextConnect
+
+    tile_map = Map([TileDTO(width=16, height=16, next_conn=NextConnect.RIGHT)])
+    ranges = distribute.split_hierarchical(256, [4, 4])
+    proc_mapping = distribute.ranges_to_mapping(ranges)
+    grid = proc_mapping[tile_map.tile_curves[0]]
+
+    perimeters = perimeter_sum.calculate_level_perimeters(grid, [4, 4])
+    assert perimeters[-1] == perimeter_sum.calculate_total_perimeter(grid)
+    # four nodes of 8x8 cells on the hilbert curve
+    assert perimeters[0] == 4 * 4 * 8
+
+    cuts = perimeter_sum.get_level_edge_cuts(tile_map, proc_mapping, [4, 4])
+    assert cuts[0] == 2 * 16
+    assert cuts[-1] == perimeter_sum.get_communication_metrics(tile_map, proc_mapping).edge_cut
+    assert cuts[0] <= cuts[1]
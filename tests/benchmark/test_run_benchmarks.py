@@ -0,0 +1,39 @@
+import json
+
+from benchmark import run_benchmarks
+from benchmark.run_benchmarks import Case, run_case
+
+
+def test_run_case_times_every_stage():
+    result = run_case(Case('cube', 8, 4))
+    assert not result.error
+    assert list(result.stages) == run_benchmarks.STAGES
+    assert all(r['seconds'] >= 0 and r['peak_rss_mb'] > 0 and r['rss_growth_mb'] >= 0 for r in result.stages.values())
+    assert result.n_points == 6 * 64
+    assert result.metrics['imbalance'] == 1.0
+
+
+def test_run_case_records_errors():
+    # z-order can't leave through the side next to its start corner
+    result = run_case(Case('cube', 8, 4, curve='morton'))
+    assert 'couldn\'t get matching sfcurve' in result.error
+
+
+def test_main_writes_json_and_compares(tmp_path, capsys):
+    output = tmp_path / 'results.json'
+    args = ['--sizes', '8', '--layouts', 'square', '--procs', '2', '--in-process', '--export', 'csv']
+    run_benchmarks.main(args + ['-o', str(output)])
+    with open(output) as f:
+        report = json.load(f)
+    assert report['environment']['numpy']
+    assert report['results'][0]['case']['size'] == 8
+
+    run_benchmarks.main(args + ['--trace', '--compare', str(output)])
+    assert 'square/8/2/gilbert: curve x' in capsys.readouterr().out
+
+
+def test_perimeter_sum_follows_the_partition():
+    one, four = run_case(Case('square', 8, 1)), run_case(Case('square', 8, 4))
+    assert one.metrics['perimeter_sum'] == 4 * 8
+    # four 4x4 quadrants
+    assert four.metrics['perimeter_sum'] == 4 * 4 * 4
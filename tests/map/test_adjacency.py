@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from lib.map.adjacency import Seam, map_edges, side_indices
+from lib.map.map import Map, TileDTO, NextConnect
+
+
+def _edge_set(edges):
+    return {tuple(sorted(e)) for e in edges.tolist()}
+
+
+def test_edges_inside_tiles_and_on_seam():
+    tile_map = Map([TileDTO(width=2, height=2, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=2, height=2, next_conn=NextConnect.BOTTOM)])
+    edges = map_edges(tile_map)
+
+    assert len(edges) == 4 + 4 + 2
+    assert len(_edge_set(edges)) == len(edges)
+    right = side_indices(tile_map.tile_curves[0], NextConnect.RIGHT)
+    left = side_indices(tile_map.tile_curves[1], NextConnect.LEFT)
+    assert _edge_set(np.stack([right, left], axis=1)) <= _edge_set(edges)
+
+
+def test_seam_between_different_sizes_is_aligned_at_curve_crossing():
+    tile_map = Map([TileDTO(width=2, height=2, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=4, height=4, next_conn=NextConnect.BOTTOM)])
+    edges = _edge_set(map_edges(tile_map))
+
+    # the curve leaves tile 0 by its last cell and enters tile 1 by its first one
+    assert (3, 4) in edges
+    assert len(edges) == 4 + 24 + 2
+
+
+def test_extra_seams():
+    tile_map = Map([TileDTO(width=3, height=3, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=3, height=3, next_conn=NextConnect.BOTTOM)])
+    seam = Seam(0, NextConnect.TOP, 1, NextConnect.TOP, reverse=True)
+    edges = map_edges(tile_map, [seam])
+
+    top0 = tile_map.tile_curves[0][0, :]
+    top1 = tile_map.tile_curves[1][0, :]
+    assert _edge_set(np.stack([top0, top1[::-1]], axis=1)) <= _edge_set(edges)
+    assert len(edges) == 12 + 12 + 3 + 3
+
+    with pytest.raises(ValueError):
+        map_edges(Map([TileDTO(width=2, height=3, next_conn=NextConnect.RIGHT)]),
+                  [Seam(0, NextConnect.TOP, 0, NextConnect.LEFT)])
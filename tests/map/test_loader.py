@@ -62,4 +62,16 @@ def test_case_insensitive_connections():
         f.flush()
         tiles = load_tile_dtos(f.name)
 
-    assert tiles[0].next_conn == NextConnect.RIGHT
\ No newline at end of file
+    assert tiles[0].next_conn == NextConnect.RIGHT
+
+def test_curve_per_tile():
+    """Tiles use gilbert unless the config names another curve"""
+    config = [{"width": 2, "height": 4, "connection": "RIGHT"},
+              {"width": 3, "height": 3, "connection": "RIGHT", "curve": "peano"}]
+
+    with NamedTemporaryFile('w', suffix='.json') as f:
+        json.dump(config, f)
+        f.flush()
+        tiles = load_tile_dtos(f.name)
+
+    assert [t.curve for t in tiles] == ["gilbert", "peano"]
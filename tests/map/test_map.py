@@ -103,3 +103,59 @@ def test_reverse_lookup_mixed_sizes():
     tile_map = Map(tile_dtos)
     for i in range(6):
         assert tile_map.get_ind(*tile_map.get_by_ind(i)) == i
+
+
+def test_batched_reverse_lookup(basic_tile_dtos):
+    """get_by_ind accepts an array of indices"""
+    tile_map = Map(basic_tile_dtos)
+    indices = np.arange(tile_map.get_total_n())
+    t, y, x = tile_map.get_by_ind(indices)
+
+    assert t.dtype == np.int32
+    for i in indices:
+        assert (t[i], y[i], x[i]) == tile_map.get_by_ind(i)
+        assert tile_map.get_ind(t[i], y[i], x[i]) == i
+
+
+def test_parallel_construction_matches_sequential():
+    """Tiles built in a process pool give the same map"""
+    tile_dtos = [
+        TileDTO(width=10, height=5, next_conn=NextConnect.RIGHT),
+        TileDTO(width=8, height=8, next_conn=NextConnect.TOP),
+        TileDTO(width=7, height=8, next_conn=NextConnect.RIGHT),
+        TileDTO(width=8, height=8, next_conn=NextConnect.TOP),
+    ]
+    sequential = Map(tile_dtos)
+    parallel = Map(tile_dtos, workers=2)
+
+    assert parallel.tiles == sequential.tiles
+    for a, b in zip(sequential.tile_curves, parallel.tile_curves):
+        assert np.array_equal(a, b)
+    for idx in range(sequential.get_total_n()):
+        assert parallel.get_by_ind(idx) == sequential.get_by_ind(idx)
+
+
+def test_tiles_with_different_curves():
+    """Tiles can use different curve backends and the curve still runs through every cell in order"""
+    tile_map = Map([TileDTO(width=9, height=9, next_conn=NextConnect.RIGHT, curve='peano'),
+                    TileDTO(width=6, height=9, next_conn=NextConnect.BOTTOM, curve='snake')])
+    t, y, x = tile_map.get_by_ind(np.arange(tile_map.get_total_n()))
+    steps = np.abs(np.diff(y)) + np.abs(np.diff(x))
+    assert np.all(steps[t[1:] == t[:-1]] == 1)
+    assert tile_map.tiles[1].curve == 'snake'
+
+
+def test_build_fetches_each_curve_once_when_uncached():
+    from lib import curves
+
+    curves.curve_cache.clear()
+    max_bytes = curves.curve_cache.max_bytes
+    misses = curves.curve_cache.info().misses
+    # nothing fits, every lookup builds the curve again
+    curves.curve_cache.resize(0)
+    try:
+        tile_map = Map([TileDTO(width=8, height=8, next_conn=conn) for conn in [NextConnect.RIGHT, NextConnect.TOP] * 3])
+    finally:
+        curves.curve_cache.resize(max_bytes)
+    assert curves.curve_cache.info().misses - misses == 1
+    assert sorted(np.concatenate([np.ravel(c) for c in tile_map.tile_curves]).tolist()) == list(range(6 * 64))
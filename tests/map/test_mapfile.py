@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from lib import distribute
+from lib.map.map import Map, TileDTO, NextConnect
+from lib.map.mapfile import save_map_file, load_map_file
+
+
+@pytest.fixture
+def tile_map():
+    return Map([
+        TileDTO(width=10, height=5, next_conn=NextConnect.RIGHT),
+        TileDTO(width=8, height=8, next_conn=NextConnect.TOP),
+        TileDTO(width=8, height=8, next_conn=NextConnect.RIGHT, curve='snake'),
+    ])
+
+
+def test_roundtrip(tile_map, tmp_path):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 7)
+    save_map_file(tile_map, tmp_path / "map.sfc", proc_mapping)
+    loaded = load_map_file(tmp_path / "map.sfc")
+
+    assert loaded.tiles == tile_map.tiles
+    assert loaded.get_total_n() == tile_map.get_total_n()
+    for curve, loaded_curve in zip(tile_map.tile_curves, loaded.tile_curves):
+        assert np.array_equal(curve, loaded_curve)
+    assert np.array_equal(loaded.proc_mapping, proc_mapping)
+    for idx in range(tile_map.get_total_n()):
+        assert loaded.get_by_ind(idx) == tile_map.get_by_ind(idx)
+        assert loaded.get_ind(*loaded.get_by_ind(idx)) == idx
+
+
+def test_loaded_map_is_read_only(tile_map, tmp_path):
+    save_map_file(tile_map, tmp_path / "map.sfc")
+    loaded = load_map_file(tmp_path / "map.sfc")
+
+    assert loaded.proc_mapping is None
+    with pytest.raises(ValueError):
+        loaded.tile_curves[0][0, 0] = 1
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "mapping.csv"
+    path.write_text("# t,y,x,p\n")
+    with pytest.raises(ValueError):
+        load_map_file(path)
+
+
+def test_rejects_mapping_of_wrong_size(tile_map, tmp_path):
+    with pytest.raises(ValueError):
+        save_map_file(tile_map, tmp_path / "map.sfc", np.zeros(3, dtype=int))
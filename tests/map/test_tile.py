@@ -1,7 +1,7 @@
 import pytest
 import numpy as np
 
-from lib.map.tile import Tile, CornerPlace, construct_curve, NextConnect, _get_sides, get_places
+from lib.map.tile import Tile, CornerPlace, construct_curve, curve_positions, NextConnect, _get_sides, get_places
 
 def _assert_curve(curve, end, tile):
     # Basic checks
@@ -74,3 +74,57 @@ def test_construct_curve_returns_valid_end():
     tile = Tile(width=4, height=4, start=CornerPlace.TOP_LEFT, next_conn=NextConnect.BOTTOM)
     curve, end = construct_curve(tile)
     _assert_curve(curve, end, tile)
+
+def test_construct_curve_shares_canonical_curve():
+    """Tiles of the same size are views of one cached curve"""
+    first, _ = construct_curve(Tile(width=6, height=6, start=CornerPlace.TOP_LEFT, next_conn=NextConnect.RIGHT))
+    second, end = construct_curve(Tile(width=6, height=6, start=CornerPlace.BOT_RIGHT, next_conn=NextConnect.TOP))
+
+    assert np.shares_memory(first, second)
+    assert not second.flags.writeable
+    _assert_curve(second, end, Tile(width=6, height=6, start=CornerPlace.BOT_RIGHT, next_conn=NextConnect.TOP))
+
+def test_curve_positions_invert_curve():
+    """curve_positions gives the cell of every curve index"""
+    for start in CornerPlace:
+        tile = Tile(width=7, height=4, start=start, next_conn=NextConnect.BOTTOM if start in
+                    (CornerPlace.TOP_LEFT, CornerPlace.TOP_RIGHT) else NextConnect.TOP)
+        curve, _ = construct_curve(tile)
+        rows, cols = curve_positions(tile)
+        assert np.array_equal(curve[rows, cols], np.arange(7 * 4))
+
+@pytest.mark.parametrize("curve,width,height", [("snake", 5, 3), ("snake", 4, 4), ("peano", 9, 9), ("morton", 8, 8)])
+def test_construct_curve_other_backends(curve, width, height):
+    """Every backend is oriented to the same corner constraints"""
+    tile = Tile(width=width, height=height, start=CornerPlace.TOP_RIGHT, next_conn=NextConnect.LEFT, curve=curve)
+    result, end = construct_curve(tile)
+    _assert_curve(result, end, tile)
+    rows, cols = curve_positions(tile)
+    assert np.array_equal(result[rows, cols], np.arange(width * height))
+
+def test_construct_curve_unsatisfiable_backend():
+    """Z-order always ends in the opposite corner, so it can't leave through a side of its start"""
+    tile = Tile(width=4, height=4, start=CornerPlace.TOP_LEFT, next_conn=NextConnect.TOP, curve="morton")
+    with pytest.raises(Exception, match="couldn't get matching sfcurve"):
+        construct_curve(tile)
+
+
+def test_construct_curve_after_backend_is_replaced():
+    """Orientations resolved for a backend aren't reused for the one registered over it"""
+    from lib import curves
+
+    def columns(N, M):
+        index_to_yx, yx_to_index = curves.curve_mappings('snake', M, N)
+        return index_to_yx[:, ::-1], yx_to_index.T
+
+    tile = Tile(width=4, height=4, start=CornerPlace.TOP_LEFT, next_conn=NextConnect.BOTTOM, curve='mine')
+    curves.register_curve('mine', lambda N, M: curves.curve_mappings('snake', N, M))
+    try:
+        _assert_curve(*construct_curve(tile), tile)
+        curves.register_curve('mine', columns)
+        curve, end = construct_curve(tile)
+        _assert_curve(curve, end, tile)
+        rows, cols = curve_positions(tile)
+        assert np.array_equal(curve[rows, cols], np.arange(16))
+    finally:
+        del curves.CURVES['mine']
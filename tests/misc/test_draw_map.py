@@ -0,0 +1,113 @@
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use('Agg')
+
+from lib import curves, distribute
+from lib.map.map import Map, TileDTO, NextConnect
+from lib.misc import draw, draw_map
+
+
+@pytest.fixture
+def tile_map():
+    return Map([TileDTO(width=6, height=4, next_conn=NextConnect.RIGHT),
+                TileDTO(width=4, height=4, next_conn=NextConnect.TOP),
+                TileDTO(width=4, height=6, next_conn=NextConnect.LEFT),
+                TileDTO(width=5, height=3, next_conn=NextConnect.BOTTOM)])
+
+
+def test_tile_positions_match_curve_cells(tile_map):
+    base_coords, tile_rects = draw_map.calculate_tile_positions(tile_map)
+    for idx in range(tile_map.get_total_n()):
+        t, y, x = tile_map.get_by_ind(idx)
+        tile_x, tile_y, _, height = tile_rects[t]
+        assert base_coords[idx] == pytest.approx((tile_x + x, tile_y + height - y))
+
+
+def test_raster_paints_every_cell(tile_map):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 5)
+    image = draw_map.render_map_raster(tile_map, proc_mapping, margin=1)
+    lut = draw_map.colormap_lut(5)
+
+    painted = np.any(image != 255, axis=2).sum()
+    assert painted == tile_map.get_total_n()
+    # the image holds exactly the colour of every cell's processor
+    colours = {tuple(c) for c in image.reshape(-1, 3)} - {(255, 255, 255)}
+    assert colours == {tuple(lut[p]) for p in range(5)}
+
+
+def test_raster_from_ranges_matches_mapping(tile_map, tmp_path):
+    ranges = distribute.split_into_ranges(tile_map.get_total_n(), 5)
+    proc_mapping = distribute.ranges_to_mapping(ranges)
+    assert np.array_equal(draw_map.render_map_raster(tile_map, ranges=ranges, max_side=7),
+                          draw_map.render_map_raster(tile_map, proc_mapping, max_side=7))
+    for mode in ('lines', 'raster'):
+        fig = draw_map.visualize_map(tile_map, ranges=ranges, mode=mode, save_as=str(tmp_path / f'{mode}.png'))
+        assert fig.axes[0].get_title().endswith('N_p = 5')
+
+
+def test_raster_tiles_follow_positions(tile_map):
+    """Raster tiles are laid out like calculate_tile_positions, one pixel per cell"""
+    proc_mapping = np.arange(tile_map.get_total_n()) % 7
+    image = draw_map.render_map_raster(tile_map, proc_mapping, margin=0)
+    lut = draw_map.colormap_lut(7)
+
+    first = tile_map.tile_curves[0]
+    # the first tile is on the bottom left of the layout
+    block = image[image.shape[0] - first.shape[0]:, :first.shape[1]]
+    assert np.array_equal(block, lut[proc_mapping[first]])
+
+
+def test_raster_downsamples_large_maps():
+    tile_map = Map([TileDTO(width=300, height=200, next_conn=NextConnect.RIGHT)])
+    image = draw_map.render_map_raster(tile_map, np.zeros(300 * 200, dtype=int), max_side=100)
+    assert image.shape == (67, 100, 3)
+
+
+def test_visualize_map_raster_mode(tile_map, tmp_path):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 3)
+    draw_map.visualize_map(tile_map, proc_mapping, save_as=str(tmp_path / "map.png"), show=False, mode='raster')
+    assert (tmp_path / "map.png").exists()
+
+
+def test_grid_raster_matches_processor_grid():
+    index_to_xy, xy_to_index = curves.hilbert_mappings(8, 5)
+    proc_map = distribute.split_into_processors(40, 4)
+    image = draw.render_grid_raster(8, 5, index_to_xy, proc_map)
+    lut = draw_map.colormap_lut(4)
+    # rows are y from the top, columns are x
+    assert image.shape == (5, 8, 3)
+    assert np.array_equal(image, lut[np.take(proc_map, xy_to_index).T[::-1]])
+
+
+def test_figures_are_not_kept_by_pyplot(tile_map, tmp_path):
+    import matplotlib.pyplot as plt
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 3)
+    before = plt.get_fignums()
+    fig = draw_map.visualize_map(tile_map, proc_mapping, save_as=str(tmp_path / "lines.png"), mode='lines')
+    draw.plot_mapping(8, 5, curves.hilbert_mappings(8, 5)[0], distribute.split_into_processors(40, 4),
+                      str(tmp_path / "grid.png"))
+    assert plt.get_fignums() == before
+    assert fig.canvas.get_renderer() is not None
+    assert (tmp_path / "lines.png").exists() and (tmp_path / "grid.png").exists()
+
+
+@pytest.mark.parametrize("threads", [True, False])
+def test_render_partitions(tile_map, tmp_path, threads):
+    proc_mappings = [distribute.split_into_processors(tile_map.get_total_n(), n_p) for n_p in (2, 3, 4)]
+    paths = [str(tmp_path / f"map_{i}.png") for i in range(3)]
+    assert draw_map.render_partitions(tile_map, proc_mappings, paths, workers=2, threads=threads) == paths
+    assert all((tmp_path / f"map_{i}.png").stat().st_size > 0 for i in range(3))
+
+
+def test_drawing_modules_import_matplotlib_lazily():
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    code = ("import sys; import lib.misc.draw, lib.misc.draw_map; "
+            "print(any(m.startswith('matplotlib') for m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=Path(__file__).parents[2])
+    assert result.stdout.strip() == 'False'
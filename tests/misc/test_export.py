@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from lib import distribute
+from lib.map.map import Map, TileDTO, NextConnect
+from lib.misc.export import save_map
+
+
+@pytest.fixture
+def tile_map():
+    return Map([TileDTO(width=5, height=3, next_conn=NextConnect.RIGHT),
+                TileDTO(width=4, height=4, next_conn=NextConnect.BOTTOM)])
+
+
+def _expected_rows(tile_map, proc_mapping=None):
+    rows = []
+    for t, curve in enumerate(tile_map.tile_curves):
+        for y in range(curve.shape[0]):
+            for x in range(curve.shape[1]):
+                i = tile_map.get_ind(t, y, x)
+                rows.append([t, y, x, i] + ([proc_mapping[i]] if proc_mapping is not None else []))
+    return np.array(rows)
+
+
+@pytest.mark.parametrize("chunk_cells", [1, 4, 7, 1000])
+def test_save_map_csv(tile_map, tmp_path, chunk_cells):
+    path = tmp_path / "mapping.csv"
+    save_map(tile_map, str(path), chunk_cells=chunk_cells)
+
+    assert path.read_text().splitlines()[0] == "# t,y,x,i"
+    assert np.array_equal(np.loadtxt(path, dtype=int), _expected_rows(tile_map))
+
+
+def test_save_map_with_processors(tile_map, tmp_path):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 4)
+    path = tmp_path / "mapping.csv"
+    save_map(tile_map, str(path), proc_mapping)
+
+    assert path.read_text().splitlines()[0] == "# t,y,x,i,p"
+    assert np.array_equal(np.loadtxt(path, dtype=int), _expected_rows(tile_map, proc_mapping))
+
+
+def test_save_map_compressed(tile_map, tmp_path):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 4)
+    path = tmp_path / "mapping.npz"
+    save_map(tile_map, str(path), proc_mapping, compressed=True, chunk_cells=5)
+
+    expected = _expected_rows(tile_map, proc_mapping)
+    with np.load(path) as columns:
+        assert list(columns.keys()) == ['t', 'y', 'x', 'i', 'p']
+        assert np.array_equal(np.stack([columns[k] for k in columns.keys()], axis=1), expected)
+
+
+def test_save_map_doesnt_print(tile_map, tmp_path, capsys):
+    save_map(tile_map, str(tmp_path / "mapping.csv"))
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_save_map_with_ranges(tile_map, tmp_path, compressed):
+    ranges = distribute.split_into_ranges(tile_map.get_total_n(), 4)
+    from_ranges, from_mapping = tmp_path / "ranges", tmp_path / "mapping"
+    save_map(tile_map, str(from_ranges), ranges=ranges, compressed=compressed, chunk_cells=5)
+    save_map(tile_map, str(from_mapping), distribute.ranges_to_mapping(ranges), compressed=compressed, chunk_cells=5)
+    assert from_ranges.read_bytes() == from_mapping.read_bytes()
+
+    with pytest.raises(ValueError):
+        save_map(tile_map, str(from_ranges), distribute.ranges_to_mapping(ranges), ranges=ranges)
+
+
+def test_save_map_compressed_walks_the_map_once(tile_map, tmp_path, monkeypatch):
+    from lib.misc import export
+    calls = []
+    map_chunks = export._map_chunks
+    monkeypatch.setattr(export, '_map_chunks', lambda *args: calls.append(args) or map_chunks(*args))
+    save_map(tile_map, str(tmp_path / "mapping.npz"), np.zeros(tile_map.get_total_n(), dtype=int), compressed=True)
+    assert len(calls) == 1
+    assert not [p for p in tmp_path.iterdir() if p.name != "mapping.npz"]
@@ -0,0 +1,206 @@
+import numpy as np
+import pytest
+
+from lib import curves
+
+
+@pytest.mark.parametrize("width,height", [(1, 1), (1, 7), (7, 1), (2, 2), (3, 5), (8, 8), (10, 5), (17, 33), (40, 23)])
+def test_gilbert2d_array_matches_recursive_order(width, height):
+    """The array engine must produce exactly the gilbert2d traversal"""
+    expected = np.array(curves.generate2d(0, 0, 0, height, width, 0))
+    actual = curves.gilbert2d_array(width, height)
+
+    assert actual.dtype == np.int32
+    assert np.array_equal(actual, expected)
+
+
+def test_gilbert2d_array_visits_every_cell_once():
+    points = curves.gilbert2d_array(100, 37)
+    grid = np.zeros((100, 37), dtype=int)
+    np.add.at(grid, (points[:, 0], points[:, 1]), 1)
+    assert np.all(grid == 1)
+
+
+def test_gilbert2d_array_rejects_empty_grid():
+    with pytest.raises(ValueError):
+        curves.gilbert2d_array(0, 5)
+
+
+def test_generate_hilbert_mappings_are_inverse():
+    index_to_xy, xy_to_index = curves.generate_hilbert_mappings(12, 9)
+    assert np.array_equal(xy_to_index[index_to_xy[:, 0], index_to_xy[:, 1]], np.arange(12 * 9))
+    # the last point is always moved into a corner
+    assert tuple(index_to_xy[-1]) in {(0, 0), (0, 8), (11, 8), (11, 0)}
+
+
+def test_hilbert_mappings_are_cached_read_only():
+    cache = curves.CurveCache(max_bytes=2**20)
+    first = cache.get((6, 4), lambda: curves._build_hilbert_mappings(6, 4))
+    second = cache.get((6, 4), lambda: curves._build_hilbert_mappings(6, 4))
+
+    assert first is second
+    assert not first[1].flags.writeable
+    info = cache.info()
+    assert (info.hits, info.misses, info.entries) == (1, 1, 1)
+    assert info.nbytes == first[0].nbytes + first[1].nbytes
+
+
+def test_curve_cache_evicts_least_recently_used():
+    one_entry = sum(a.nbytes for a in curves._build_hilbert_mappings(8, 8))
+    cache = curves.CurveCache(max_bytes=2 * one_entry)
+    for key in [(8, 8), (8, 8), (1, 1), (8, 8)]:
+        cache.get(key, lambda: curves._build_hilbert_mappings(*key))
+    cache.get((2, 32), lambda: curves._build_hilbert_mappings(2, 32))
+
+    info = cache.info()
+    assert info.evictions == 1
+    assert info.nbytes <= info.max_bytes
+    # (1, 1) was used least recently, so it is the one evicted
+    cache.get((8, 8), lambda: pytest.fail("(8, 8) should still be cached"))
+
+
+def test_curve_cache_skips_values_over_budget():
+    cache = curves.CurveCache(max_bytes=16)
+    cache.get((8, 8), lambda: curves._build_hilbert_mappings(8, 8))
+    assert cache.info().entries == 0
+
+
+def test_generate_hilbert_mappings_returns_writable_copies():
+    index_to_xy, xy_to_index = curves.generate_hilbert_mappings(5, 5)
+    xy_to_index += 1
+    assert curves.generate_hilbert_mappings(5, 5)[1].min() == 0
+
+
+@pytest.mark.parametrize("n", [1, 2, 4, 16, 64])
+def test_d_to_xy_matches_mappings(n):
+    index_to_xy, _ = curves.hilbert_mappings(n, n)
+    xs, ys = curves.d_to_xy(np.arange(n * n), n)
+    assert np.array_equal(xs, index_to_xy[:, 0])
+    assert np.array_equal(ys, index_to_xy[:, 1])
+
+
+@pytest.mark.parametrize("n", [1, 2, 8, 32])
+def test_xy_to_d_matches_mappings(n):
+    _, xy_to_index = curves.hilbert_mappings(n, n)
+    xs, ys = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    assert np.array_equal(curves.xy_to_d(xs, ys, n), xy_to_index)
+
+
+def test_xy_to_d_on_perimeter_only():
+    n = 2**14
+    xs = np.concatenate([np.zeros(n, dtype=int), np.arange(n)])
+    ys = np.concatenate([np.arange(n), np.full(n, n - 1)])
+    ds = curves.xy_to_d(xs, ys, n)
+    assert ds[0] == 0
+    assert np.array_equal(np.stack(curves.d_to_xy(ds, n)), np.stack([xs, ys]))
+
+
+def test_bit_functions_reject_bad_input():
+    with pytest.raises(ValueError):
+        curves.d_to_xy([0], 6)
+    with pytest.raises(ValueError):
+        curves.d_to_xy([16], 4)
+    with pytest.raises(ValueError):
+        curves.xy_to_d([4], [0], 4)
+
+
+def test_hilbert_endpoints_without_generation():
+    for N in range(1, 25):
+        for M in range(1, 25):
+            index_to_xy, _ = curves.hilbert_mappings(N, M)
+            first, last = curves.hilbert_endpoints(N, M)
+            assert first == tuple(index_to_xy[0])
+            assert last == tuple(index_to_xy[-1])
+
+
+@pytest.mark.parametrize("width,height,depth", [(1, 1, 1), (5, 1, 1), (1, 1, 6), (3, 5, 7), (9, 4, 2), (2, 3, 11)])
+def test_gilbert3d_array_visits_every_cell_once(width, height, depth):
+    points = curves.gilbert3d_array(width, height, depth)
+    grid = np.zeros((width, height, depth), dtype=int)
+    np.add.at(grid, (points[:, 0], points[:, 1], points[:, 2]), 1)
+
+    assert points.dtype == np.int32
+    assert np.all(grid == 1)
+    assert tuple(points[0]) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("width,height,depth", [(2, 2, 2), (8, 8, 8), (16, 16, 16), (4, 10, 6), (12, 2, 8)])
+def test_gilbert3d_array_unit_steps_on_even_boxes(width, height, depth):
+    points = curves.gilbert3d_array(width, height, depth)
+    assert np.all(np.abs(np.diff(points, axis=0)).sum(axis=1) == 1)
+
+
+def test_gilbert3d_matches_array():
+    assert curves.gilbert3d(3, 2, 4) == [tuple(p) for p in curves.gilbert3d_array(3, 2, 4).tolist()]
+
+
+def test_generate_hilbert_mappings3d_are_inverse():
+    index_to_xyz, xyz_to_index = curves.generate_hilbert_mappings3d(6, 5, 4)
+    assert xyz_to_index.shape == (6, 5, 4)
+    assert np.array_equal(xyz_to_index[index_to_xyz[:, 0], index_to_xyz[:, 1], index_to_xyz[:, 2]],
+                          np.arange(6 * 5 * 4))
+
+
+@pytest.mark.parametrize("name,N,M", [("gilbert", 9, 7), ("morton", 8, 8), ("morton", 5, 7),
+                                      ("peano", 27, 27), ("snake", 6, 5)])
+def test_curve_backends_follow_mapping_contract(name, N, M):
+    index_to_xy, xy_to_index = curves.curve_mappings(name, N, M)
+    assert xy_to_index.shape == (N, M)
+    assert np.array_equal(xy_to_index[index_to_xy[:, 0], index_to_xy[:, 1]], np.arange(N * M))
+    first, last = curves.curve_endpoints(name, N, M)
+    assert tuple(index_to_xy[0]) == first and tuple(index_to_xy[-1]) == last
+
+
+@pytest.mark.parametrize("name", ["peano", "snake"])
+def test_continuous_backends_take_unit_steps(name):
+    index_to_xy, _ = curves.curve_mappings(name, 27, 27)
+    assert np.all(np.abs(np.diff(index_to_xy, axis=0)).sum(axis=1) == 1)
+
+
+def test_morton_curve_interleaves_bits():
+    _, xy_to_index = curves.curve_mappings('morton', 4, 4)
+    assert xy_to_index.tolist() == [[0, 1, 4, 5], [2, 3, 6, 7], [8, 9, 12, 13], [10, 11, 14, 15]]
+    assert curves.morton_keys(np.array([3, 5]), np.array([1, 2])).tolist() == [11, 38]
+
+
+def test_peano_curve_needs_power_of_three():
+    with pytest.raises(ValueError):
+        curves.curve_mappings('peano', 8, 8)
+    with pytest.raises(ValueError):
+        curves.curve_mappings('peano', 9, 3)
+
+
+def test_unknown_curve():
+    with pytest.raises(ValueError):
+        curves.curve_mappings('dragon', 4, 4)
+
+
+def test_register_curve_without_endpoints():
+    def build(N, M):
+        index_to_yx, yx_to_index = curves.curve_mappings('snake', M, N)
+        return index_to_yx[:, ::-1], yx_to_index.T
+
+    curves.register_curve('columns', build)
+    try:
+        index_to_xy, xy_to_index = curves.curve_mappings('columns', 3, 4)
+        assert curves.curve_endpoints('columns', 3, 4) == (tuple(index_to_xy[0]), tuple(index_to_xy[-1]))
+    finally:
+        del curves.CURVES['columns']
+
+
+def test_register_curve_replaces_gilbert():
+    gilbert = curves.CURVES['gilbert']
+    expected = curves.curve_mappings('snake', 4, 6)
+    hilbert = curves.hilbert_mappings(4, 6)
+    curves.curve_mappings('gilbert', 4, 6)
+    curves.register_curve('gilbert', lambda N, M: curves.curve_mappings('snake', N, M))
+    try:
+        assert all(np.array_equal(a, b) for a, b in zip(curves.curve_mappings('gilbert', 4, 6), expected))
+        # hilbert_mappings keeps the built-in curve
+        assert all(np.array_equal(a, b) for a, b in zip(curves.hilbert_mappings(4, 6), hilbert))
+    finally:
+        curves.register_curve('gilbert', gilbert.build, gilbert.endpoints)
+    # registering again drops the cached arrays, also those under gilbert's (N, M) keys
+    restored = curves.curve_mappings('gilbert', 4, 6)
+    assert restored[0] is not hilbert[0]
+    assert all(np.array_equal(a, b) for a, b in zip(restored, hilbert))
@@ -0,0 +1,323 @@
+import numpy as np
+import pytest
+
+from lib import distribute
+from lib import curves
+
+
+def test_split_into_processors_spreads_remainder():
+    mapping = distribute.split_into_processors(10, 4)
+    assert mapping.tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 3, 3]
+
+
+def test_split_into_processors_more_processors_than_points():
+    assert distribute.split_into_processors(3, 5).tolist() == [0, 1, 2]
+
+
+def test_split_into_processors_rejects_zero():
+    with pytest.raises(Exception):
+        distribute.split_into_processors(10, 0)
+
+
+def test_split_into_ranges():
+    ranges = distribute.split_into_ranges(10, 4)
+    assert ranges.tolist() == [[0, 3], [3, 6], [6, 8], [8, 10]]
+
+
+def test_ranges_match_mapping():
+    ranges = distribute.split_into_ranges(1000, 7)
+    mapping = distribute.ranges_to_mapping(ranges)
+    assert np.array_equal(mapping, distribute.split_into_processors(1000, 7))
+    assert np.array_equal(distribute.lookup_processors(ranges, np.arange(1000)), mapping)
+
+
+def test_lookup_processors_on_grid():
+    _, xy_to_index = curves.hilbert_mappings(16, 12)
+    ranges = distribute.split_into_ranges(16 * 12, 5)
+    expected = np.take(distribute.ranges_to_mapping(ranges), xy_to_index)
+    assert np.array_equal(distribute.lookup_processors(ranges, xy_to_index), expected)
+
+
+def test_lookup_processors_skips_empty_ranges():
+    ranges = np.array([[0, 2], [2, 2], [2, 5], [5, 5]])
+    assert distribute.lookup_processors(ranges, np.arange(5)).tolist() == [0, 0, 2, 2, 2]
+
+
+def test_split_weighted_uniform_matches_equal_split():
+    ranges = distribute.split_weighted(np.ones(12), 4)
+    assert ranges.tolist() == distribute.split_into_ranges(12, 4).tolist()
+
+
+def test_split_weighted_balances_heavy_cells():
+    weights = np.ones(100)
+    weights[:10] = 10  # first 10 cells cost as much as the other 90
+    ranges = distribute.split_weighted(weights, 2)
+
+    assert ranges.tolist() == [[0, 10], [10, 100]]
+    assert distribute.range_loads(ranges, weights).tolist() == [100, 90]
+    assert distribute.imbalance(ranges, weights) == pytest.approx(100 / 95)
+
+
+def test_split_weighted_covers_curve_contiguously():
+    rng = np.random.default_rng(0)
+    weights = rng.uniform(0.1, 10, size=5000)
+    ranges = distribute.split_weighted(weights, 37)
+
+    assert ranges[0, 0] == 0 and ranges[-1, 1] == 5000
+    assert np.array_equal(ranges[1:, 0], ranges[:-1, 1])
+    assert distribute.imbalance(ranges, weights) < 1.05
+
+
+def test_weights_in_curve_order():
+    curves_ = [np.array([[0, 3], [1, 2]]), np.array([[4, 5]])]
+    weights = distribute.weights_in_curve_order(curves_, [np.array([[1, 4], [2, 3]]), np.array([[5, 6]])])
+    assert weights.tolist() == [1, 2, 3, 4, 5, 6]
+
+    with pytest.raises(ValueError):
+        distribute.weights_in_curve_order(curves_, [np.ones((2, 2)), np.ones((2, 1))])
+
+
+def test_split_weighted_rejects_negative_weights():
+    with pytest.raises(ValueError):
+        distribute.split_weighted([1, -1, 2], 2)
+
+
+def _min_bottleneck(weights, N_p):
+    """Brute force over every placement of the cuts"""
+    import itertools
+    n = len(weights)
+    return min(max(sum(weights[b[i]:b[i + 1]]) for i in range(N_p))
+               for cuts in itertools.combinations_with_replacement(range(n + 1), N_p - 1)
+               for b in [[0, *cuts, n]])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_split_weighted_optimal_minimizes_bottleneck(seed):
+    rng = np.random.default_rng(seed)
+    weights = rng.integers(0, 30, size=9).astype(float)
+    weights[rng.integers(0, 9)] = 100  # a spike
+    ranges = distribute.split_weighted(weights, 3, method='optimal')
+
+    assert ranges[0, 0] == 0 and ranges[-1, 1] == 9
+    assert distribute.range_loads(ranges, weights).max() == _min_bottleneck(weights, 3)
+
+
+def test_split_weighted_optimal_not_worse_than_prefix():
+    rng = np.random.default_rng(7)
+    weights = rng.pareto(1.5, size=20000)
+    prefix_ranges = distribute.split_weighted(weights, 50)
+    optimal_ranges = distribute.split_weighted(weights, 50, method='optimal')
+    assert distribute.imbalance(optimal_ranges, weights) <= distribute.imbalance(prefix_ranges, weights)
+
+
+def test_split_weighted_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        distribute.split_weighted([1, 2, 3], 2, method='magic')
+
+
+def test_refine_boundaries_reduces_perimeter_within_tolerance():
+    from benchmark.perimeter_sum import calculate_total_perimeter
+
+    _, xy_to_index = curves.hilbert_mappings(40, 23)
+    ranges = distribute.split_into_ranges(40 * 23, 9)
+    refined = distribute.refine_boundaries(ranges, [xy_to_index], tolerance=0.1)
+
+    before = calculate_total_perimeter(distribute.lookup_processors(ranges, xy_to_index))
+    after = calculate_total_perimeter(distribute.lookup_processors(refined, xy_to_index))
+    assert after < before
+    loads = distribute.range_loads(refined)
+    assert loads.max() <= 1.1 * distribute.range_loads(ranges).max()
+    assert np.array_equal(refined[1:, 0], refined[:-1, 1])
+
+
+def test_refine_boundaries_zero_tolerance_keeps_bottleneck():
+    _, xy_to_index = curves.hilbert_mappings(32, 32)
+    weights = np.random.default_rng(3).uniform(1, 2, size=32 * 32)
+    ranges = distribute.split_weighted(weights, 6, method='optimal')
+    refined = distribute.refine_boundaries(ranges, [xy_to_index], weights)
+    assert distribute.range_loads(refined, weights).max() <= distribute.range_loads(ranges, weights).max()
+
+
+def test_migration_list():
+    old = np.array([[0, 4], [4, 8], [8, 12]])
+    new = np.array([[0, 3], [3, 9], [9, 12]])
+    assert distribute.migration_list(old, new).tolist() == [[3, 4, 0, 1], [8, 9, 2, 1]]
+    assert len(distribute.migration_list(old, old)) == 0
+
+
+def test_mapping_to_ranges():
+    ranges = distribute.split_into_ranges(10, 4)
+    assert np.array_equal(distribute.mapping_to_ranges(distribute.ranges_to_mapping(ranges)), ranges)
+    # processor 1 owns nothing, the chunks don't have to be in processor order
+    ranges = distribute.mapping_to_ranges(np.array([2, 2, 0, 0, 0]))
+    assert ranges.tolist() == [[2, 5], [0, 0], [0, 2]]
+    assert distribute.lookup_processors(ranges, np.arange(5)).tolist() == [2, 2, 0, 0, 0]
+    with pytest.raises(ValueError):
+        distribute.mapping_to_ranges(np.array([0, 1, 0]))
+
+
+def test_partition_session_repartition():
+    _, xy_to_index = curves.hilbert_mappings(16, 16)
+    session = distribute.PartitionSession([xy_to_index])
+
+    ranges, migration = session.repartition(4)
+    assert len(migration) == 0
+    assert np.array_equal(session.processor_grids()[0], np.take(distribute.ranges_to_mapping(ranges), xy_to_index))
+
+    old_mapping = distribute.ranges_to_mapping(ranges)
+    ranges, migration = session.repartition(5)
+    new_mapping = distribute.ranges_to_mapping(ranges)
+    moved = np.zeros(256, dtype=bool)
+    for start, end, src, dst in migration:
+        assert np.all(old_mapping[start:end] == src) and np.all(new_mapping[start:end] == dst)
+        moved[start:end] = True
+    assert np.array_equal(moved, old_mapping != new_mapping)
+
+
+def test_partition_session_before_first_repartition():
+    _, xy_to_index = curves.hilbert_mappings(4, 4)
+    session = distribute.PartitionSession([xy_to_index])
+    with pytest.raises(ValueError, match='no partition yet'):
+        session.imbalance()
+    with pytest.raises(ValueError, match='no partition yet'):
+        session.processor_grids()
+    session.repartition(2)
+    assert session.imbalance() == 1.0
+
+
+def test_partition_session_weights_as_list():
+    _, xy_to_index = curves.hilbert_mappings(3, 4)
+    weights = [1.0] * 6 + [3.0] * 6
+    session = distribute.PartitionSession([xy_to_index], weights=weights)
+    ranges, _ = session.repartition(2)
+    assert np.array_equal(ranges, distribute.split_weighted(weights, 2))
+    assert session.imbalance() == distribute.imbalance(ranges, weights)
+
+
+def test_partition_session_weights_per_grid():
+    _, xy_to_index = curves.hilbert_mappings(8, 8)
+    grid_weights = np.ones((8, 8))
+    grid_weights[:4] = 3
+    session = distribute.PartitionSession([xy_to_index])
+
+    ranges, _ = session.repartition(4, weights=[grid_weights])
+    weights = distribute.weights_in_curve_order([xy_to_index], [grid_weights])
+    assert np.array_equal(ranges, distribute.split_weighted(weights, 4))
+    assert session.imbalance() == distribute.imbalance(ranges, weights)
+
+    with pytest.raises(ValueError):
+        session.set_weights(np.ones(5))
+
+
+def test_migration_volume_per_pair():
+    old = np.array([[0, 4], [4, 8], [8, 12]])
+    new = np.array([[0, 3], [3, 9], [9, 12]])
+    assert distribute.migration_volume(old, new).tolist() == [[0, 1, 1], [2, 1, 1]]
+
+
+def test_relabel_ranges_keeps_points_in_place():
+    old = np.array([[6, 12], [0, 6]])
+    new = distribute.split_into_ranges(12, 3)  # [0, 4], [4, 8], [8, 12]
+    relabeled = distribute.relabel_ranges(old, new)
+
+    assert sorted(relabeled.tolist()) == sorted(new.tolist())
+    assert relabeled[1].tolist() == [0, 4] and relabeled[0].tolist() == [8, 12]
+    assert distribute.migration_volume(old, relabeled)[:, 2].sum() == 4
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_relabel_ranges_is_optimal(seed):
+    import itertools
+    rng = np.random.default_rng(seed)
+    old = distribute.split_weighted(rng.uniform(0, 1, size=30), 4)[rng.permutation(4)]
+    new = distribute.split_weighted(rng.uniform(0, 1, size=30), 5)
+
+    def moved(ranges):
+        return distribute.migration_volume(old, ranges)[:, 2].sum()
+
+    best = min(moved(new[list(perm)]) for perm in itertools.permutations(range(5)))
+    assert moved(distribute.relabel_ranges(old, new)) == best
+
+
+def test_minimize_migration_snaps_cuts_within_tolerance():
+    old = np.array([[0, 5], [5, 10], [10, 20]])
+    new = distribute.split_into_ranges(20, 3)  # cuts at 7 and 14
+    exact = distribute.minimize_migration(old, new)
+    snapped = distribute.minimize_migration(old, new, tolerance=0.5)
+
+    moved = lambda ranges: distribute.migration_volume(old, ranges)[:, 2].sum()
+    assert moved(snapped) < moved(exact)
+    assert distribute.range_loads(snapped).max() <= 1.5 * distribute.range_loads(new).max()
+
+
+def test_partition_session_relabel_moves_less():
+    _, xy_to_index = curves.hilbert_mappings(16, 16)
+    plain = distribute.PartitionSession([xy_to_index])
+    relabeled = distribute.PartitionSession([xy_to_index])
+    for session in (plain, relabeled):
+        session.repartition(6)
+        session.ranges = session.ranges[::-1].copy()  # as if ranks were handed out differently
+
+    _, plain_migration = plain.repartition(5)
+    _, relabeled_migration = relabeled.repartition(5, relabel=True)
+    moved = lambda migration: np.sum(migration[:, 1] - migration[:, 0])
+    assert moved(relabeled_migration) < moved(plain_migration)
+
+
+def test_partition_session_relabel_with_tolerance_matches_minimize_migration():
+    _, xy_to_index = curves.hilbert_mappings(16, 16)
+    weights = np.random.default_rng(3).random(256)
+    session = distribute.PartitionSession([xy_to_index], weights)
+    old, _ = session.repartition(6)
+    new = distribute.split_weighted(weights, 7)
+    ranges, _ = session.repartition(7, relabel=True, tolerance=0.2)
+    assert np.array_equal(ranges, distribute.minimize_migration(old, new, weights, tolerance=0.2))
+
+    # uniform weights take the same path without prefix sums
+    old, new = distribute.split_into_ranges(256, 6), distribute.split_into_ranges(256, 7)
+    assert np.array_equal(distribute.minimize_migration(old, new, tolerance=0.2),
+                          distribute.minimize_migration(old, new, np.ones(256), tolerance=0.2))
+
+
+def test_partition_3d_curve():
+    from benchmark.perimeter_sum import calculate_total_perimeter
+
+    _, xyz_to_index = curves.hilbert_mappings3d(16, 16, 16)
+    mapping = distribute.split_into_processors(16 ** 3, 8)
+    grid = np.take(mapping, xyz_to_index)
+    # curve order follows the octants, so 8 processors get 8 cubes of 8x8x8
+    assert calculate_total_perimeter(grid) == 8 * 6 * 8 * 8
+
+    ranges = distribute.split_into_ranges(16 ** 3, 7)
+    refined = distribute.refine_boundaries(ranges, [xyz_to_index], tolerance=0.1)
+    before = calculate_total_perimeter(distribute.lookup_processors(ranges, xyz_to_index))
+    after = calculate_total_perimeter(distribute.lookup_processors(refined, xyz_to_index))
+    assert after <= before
+
+
+def test_hierarchy_groups():
+    groups = distribute.hierarchy_groups([2, 2, 3])
+    assert groups[0].tolist() == [0] * 6 + [1] * 6
+    assert groups[1].tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3]
+    assert groups[2].tolist() == list(range(12))
+
+    with pytest.raises(ValueError):
+        distribute.hierarchy_groups([2, 0])
+
+
+def test_split_hierarchical_nests_groups():
+    weights = np.random.default_rng(1).uniform(0, 5, size=1000)
+    ranges = distribute.split_hierarchical(1000, [3, 2, 4], weights)
+    groups = distribute.hierarchy_groups([3, 2, 4])
+
+    assert len(ranges) == 24
+    assert np.array_equal(ranges[1:, 0], ranges[:-1, 1])
+    # every node gets a balanced share, then every socket a balanced share of its node
+    node_loads = np.bincount(groups[0], weights=distribute.range_loads(ranges, weights))
+    assert node_loads.max() / node_loads.mean() < 1.02
+    node_ranges = distribute.split_weighted(weights, 3)
+    assert ranges[::8, 0].tolist() == node_ranges[:, 0].tolist()
+
+
+def test_split_hierarchical_single_level_is_flat():
+    assert np.array_equal(distribute.split_hierarchical(50, [7]), distribute.split_into_ranges(50, 7))
@@ -0,0 +1,88 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from lib import distribute
+from lib.halo import build_halo_exchange, cached_halo_exchange, load_halo_exchange
+from lib.map.adjacency import map_edges
+from lib.map.map import Map, TileDTO, NextConnect
+
+
+@pytest.fixture
+def tile_map():
+    return Map([TileDTO(width=6, height=5, next_conn=NextConnect.RIGHT),
+                TileDTO(width=4, height=4, next_conn=NextConnect.BOTTOM),
+                TileDTO(width=4, height=3, next_conn=NextConnect.LEFT)])
+
+
+def _bfs_halo(tile_map, proc_mapping, width):
+    """Reference: breadth-first search from the cells of every processor"""
+    n = len(proc_mapping)
+    adjacent = [[] for _ in range(n)]
+    for a, b in map_edges(tile_map):
+        adjacent[a].append(b)
+        adjacent[b].append(a)
+    halo = {}
+    for rank in range(proc_mapping.max() + 1):
+        distance = {c: 0 for c in range(n) if proc_mapping[c] == rank}
+        queue = deque(distance)
+        while queue:
+            c = queue.popleft()
+            if distance[c] == width:
+                continue
+            for d in adjacent[c]:
+                if d not in distance:
+                    distance[d] = distance[c] + 1
+                    queue.append(d)
+        halo[rank] = sorted(c for c in distance if proc_mapping[c] != rank)
+    return halo
+
+
+@pytest.mark.parametrize("width", [1, 2, 3])
+def test_matches_breadth_first_search(tile_map, width):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 5)
+    halo = build_halo_exchange(tile_map, proc_mapping, width)
+    expected = _bfs_halo(tile_map, proc_mapping, width)
+
+    for rank in range(5):
+        cells, owners = halo.recv(rank)
+        assert sorted(cells.tolist()) == expected[rank]
+        assert np.array_equal(owners, proc_mapping[cells])
+
+
+def test_send_lists_mirror_recv_lists(tile_map):
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 4)
+    halo = build_halo_exchange(tile_map, proc_mapping, width=2)
+
+    for rank in range(4):
+        cells, to = halo.send(rank)
+        assert np.all(proc_mapping[cells] == rank)
+        for peer in range(4):
+            recv_cells, recv_from = halo.recv(peer)
+            assert np.array_equal(cells[to == peer], recv_cells[recv_from == rank])
+
+
+def test_halo_crosses_tile_seams():
+    tile_map = Map([TileDTO(width=2, height=2, next_conn=NextConnect.RIGHT),
+                    TileDTO(width=2, height=2, next_conn=NextConnect.BOTTOM)])
+    halo = build_halo_exchange(tile_map, np.array([0] * 4 + [1] * 4))
+    cells, owners = halo.recv(0)
+    assert len(cells) == 2 and np.all(owners == 1)
+    assert np.all(tile_map.get_by_ind(cells)[0] == 1)
+
+
+def test_cached_halo_exchange(tile_map, tmp_path):
+    path = tmp_path / "halo.npz"
+    proc_mapping = distribute.split_into_processors(tile_map.get_total_n(), 3)
+    built = cached_halo_exchange(tile_map, proc_mapping, path, width=2)
+    loaded, _ = load_halo_exchange(path)
+    assert loaded.width == 2
+    assert np.array_equal(loaded.recv_cells, built.recv_cells)
+    assert np.array_equal(loaded.send_offsets, built.send_offsets)
+
+    # a different mapping doesn't reuse the file
+    other = distribute.split_into_processors(tile_map.get_total_n(), 4)
+    rebuilt = cached_halo_exchange(tile_map, other, path, width=2)
+    assert len(rebuilt.recv_offsets) == 5
+    assert len(load_halo_exchange(path)[0].recv_offsets) == 5
@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import main
+from lib.map.mapfile import save_map_file
+
+ROOT = Path(__file__).parent.parent
+CONFIG = ROOT / 'config.example.json'
+# imports plus partitioning the example config, measured at ~0.15 s
+STARTUP_BUDGET = 1.0
+
+
+def _run(*args, cwd):
+    return subprocess.run([sys.executable, str(ROOT / 'main.py'), *map(str, args)], cwd=cwd,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def test_partition_starts_within_budget_without_heavy_imports(tmp_path):
+    script = f"""
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {str(ROOT)!r})
+import main
+main.partition({str(CONFIG)!r}, 4, {str(tmp_path / 'map.sfc')!r})
+print(time.perf_counter() - start)
+print(sorted(m for m in sys.modules if m.split('.')[0] in ('matplotlib', 'benchmark', 'lib')))
+"""
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    seconds, modules = out.splitlines()[-2:]
+    assert 'matplotlib' not in modules
+    assert 'benchmark' not in modules
+    assert 'lib.misc' not in modules
+    assert float(seconds) < STARTUP_BUDGET
+
+
+def test_subcommands(tmp_path):
+    _run('partition', CONFIG, '-p', 5, cwd=tmp_path)
+    assert (tmp_path / 'output' / 'map.sfc').exists()
+
+    _run('export', 'output/map.sfc', '-o', 'mapping.csv', cwd=tmp_path)
+    mapping = np.loadtxt(tmp_path / 'mapping.csv', dtype=int)
+    assert sorted(set(mapping[:, -1])) == [0, 1, 2, 3, 4]
+
+    _run('render', 'output/map.sfc', '-o', 'map.png', '--mode', 'raster', cwd=tmp_path)
+    assert (tmp_path / 'map.png').stat().st_size > 0
+
+    metrics = json.loads(_run('metrics', 'output/map.sfc', '--json', cwd=tmp_path))
+    assert metrics['processors'] == 5
+    assert metrics['points'] == 370
+    assert metrics['imbalance'] == 1.0
+
+
+def test_legacy_config_argument(tmp_path):
+    (tmp_path / 'output').mkdir()
+    _run(CONFIG, cwd=tmp_path)
+    # only the partition subcommand writes a map file
+    assert {p.name for p in (tmp_path / 'output').iterdir()} == {'mapping.csv', 'hilbert_map.png'}
+
+
+def test_metrics_perimeter_follows_the_partition(tmp_path):
+    _run('partition', CONFIG, '-p', 1, '-o', 'one.sfc', cwd=tmp_path)
+    _run('partition', CONFIG, '-p', 16, '-o', 'many.sfc', cwd=tmp_path)
+    one = json.loads(_run('metrics', 'one.sfc', '--json', cwd=tmp_path))
+    many = json.loads(_run('metrics', 'many.sfc', '--json', cwd=tmp_path))
+    assert many['perimeter_sum'] > one['perimeter_sum']
+
+
+def test_metrics_of_a_non_contiguous_mapping(tmp_path):
+    tile_map, single = main.build(str(CONFIG), 1)
+    save_map_file(tile_map, tmp_path / 'single.sfc', single)
+    # every processor owns several chunks of the curve
+    proc_mapping = np.arange(tile_map.get_total_n()) // 10 % 4
+    save_map_file(tile_map, tmp_path / 'map.sfc', proc_mapping)
+    metrics = main.metrics(str(tmp_path / 'map.sfc'))
+    assert metrics['processors'] == 4
+    assert metrics['imbalance'] == np.bincount(proc_mapping).max() / (tile_map.get_total_n() / 4)
+    assert metrics['edge_cut'] > 0
+    assert metrics['perimeter_sum'] > main.metrics(str(tmp_path / 'single.sfc'))['perimeter_sum']
@@ -0,0 +1,90 @@
+import csv
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import main_1tile
+from lib import curves
+from main_1tile import parse_procs, parse_size, sweep
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_parse_sizes_and_procs():
+    assert parse_size('64') == (64, 64)
+    assert parse_size('128x96') == (128, 96)
+    assert parse_procs('12') == [12]
+    assert parse_procs('4:16:4') == [4, 8, 12, 16]
+    assert parse_procs('2:4') == [2, 3, 4]
+
+
+def test_sweep_builds_every_curve_once(tmp_path):
+    curves.curve_cache.clear()
+    misses = curves.curve_cache.info().misses
+    cases = [(16, 12, 3), (16, 16, 4), (16, 12, 5), (16, 16, 2), (16, 12, 3)]
+    rows = sweep(cases, output=str(tmp_path), workers=1)
+    assert curves.curve_cache.info().misses - misses == 2
+    assert [(row.N, row.M, row.N_p) for row in rows] == cases[:4]
+
+    for row in rows:
+        curve, proc_map, proc_2d = main_1tile.pipeline(row.N, row.M, row.N_p)
+        assert np.array_equal(np.loadtxt(row.mapping, dtype=int), proc_2d)
+    assert rows[1].imbalance == 1.0
+    assert rows[1].perimeter_sum == 4 * 16 + 2 * 16 + 2 * 16  # quadrants of a square
+
+    summary = (tmp_path / 'summary.csv').read_text().splitlines()
+    assert summary[0] == 'N,M,N_p,curve,imbalance,perimeter_sum,max_perimeter,mapping'
+    assert len(summary) == 5
+
+
+def test_sweep_in_a_pool_matches_in_process(tmp_path):
+    cases = [(N, 10, N_p) for N in (8, 12, 20) for N_p in (2, 3)]
+    pooled = sweep(cases, output=str(tmp_path / 'pool'), workers=2, fmt='npy')
+    single = sweep(cases, output=str(tmp_path / 'single'), workers=1, fmt='npy')
+    for a, b in zip(pooled, single):
+        assert (a.imbalance, a.perimeter_sum, a.max_perimeter) == (b.imbalance, b.perimeter_sum, b.max_perimeter)
+        assert np.array_equal(np.load(a.mapping), np.load(b.mapping))
+
+
+def test_sweep_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        sweep([(4, 4, 2)], output=str(tmp_path), fmt='xls')
+
+
+def test_cli_runs_without_prompting(tmp_path):
+    (tmp_path / 'output').mkdir()
+    out = subprocess.run([sys.executable, str(ROOT / 'main_1tile.py'), '8', '6', '3'], cwd=tmp_path,
+                         stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True).stdout
+    assert 'N = 8, M = 6 and N_p = 3' in out
+    assert (tmp_path / 'output' / 'hilbert_8x6_into_3.csv').exists()
+
+    out = subprocess.run([sys.executable, str(ROOT / 'main_1tile.py'), '--sweep', '--sizes', '8x6', '--procs', '2:3',
+                          '--cases', '4,4,2', '--workers', '1', '-o', 'sweep'], cwd=tmp_path,
+                         stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True).stdout
+    assert 'Saved 3 mappings' in out
+    assert len((tmp_path / 'sweep' / 'summary.csv').read_text().splitlines()) == 4
+
+
+def test_summary_quotes_paths_with_commas(tmp_path):
+    output = tmp_path / 'runs, nightly'
+    rows = sweep([(8, 8, 2)], output=str(output), workers=1)
+    with open(output / 'summary.csv', newline='') as f:
+        (row,) = csv.DictReader(f)
+    assert row['mapping'] == rows[0].mapping
+    assert int(row['N_p']) == 2
+
+
+def test_pipeline_and_sweep_share_the_split(tmp_path):
+    (row,) = sweep([(12, 10, 7)], output=str(tmp_path), workers=1, fmt='npy')
+    _, _, proc_2d = main_1tile.pipeline(12, 10, 7)
+    assert np.array_equal(np.load(row.mapping), proc_2d)
+
+
+@pytest.mark.parametrize("args", [['8', '6', '3', '--sweep', '--cases', '4,4,2'], ['--sizes', '8']])
+def test_cli_rejects_mixed_modes(args, capsys):
+    with pytest.raises(SystemExit):
+        main_1tile.cli(args)
+    assert 'error' in capsys.readouterr().err
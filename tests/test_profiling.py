@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from lib import curves, distribute, profiling
+from lib.map.map import Map, TileDTO, NextConnect
+
+
+@pytest.fixture
+def enabled():
+    profiling.reset()
+    profiling.enable(report_at_exit=False)
+    yield
+    profiling.disable()
+    profiling.reset()
+
+
+def test_disabled_records_nothing():
+    profiling.reset()
+    with profiling.stage('test.stage', cells=10) as stage:
+        stage.add_cells(5)
+    distribute.split_into_processors(100, 4)
+    profiling.count('test.counter')
+    assert profiling.report()['stages'] == {}
+    assert profiling.report()['counters'] == {}
+
+
+def test_stages_in_threads_nest_per_thread(enabled):
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+
+    barrier = threading.Barrier(4)
+
+    def work(_):
+        with profiling.stage('test.outer'):
+            barrier.wait()
+            with profiling.stage('test.inner', cells=1):
+                profiling.count('test.counter')
+            barrier.wait()
+            # the open stage of this thread is still its own outer stage
+            return profiling._open_stages()[-1].name
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(work, range(4))) == ['test.outer'] * 4
+    report = profiling.report()
+    assert report['stages']['test.outer']['calls'] == 4
+    assert report['stages']['test.inner']['cells'] == 4
+    assert report['counters']['test.counter'] == 4
+
+
+def test_pipeline_stages_are_recorded(enabled):
+    curves.curve_cache.clear()
+    Map([TileDTO(width=12, height=12, next_conn=NextConnect.RIGHT),
+         TileDTO(width=12, height=12, next_conn=NextConnect.TOP)])
+    distribute.split_into_processors(288, 4)
+
+    stages = profiling.report()['stages']
+    assert stages['map.build']['cells'] == 288
+    assert stages['curves.build']['calls'] == 1
+    assert stages['distribute.split_into_processors']['cells'] == 288
+    assert profiling.report()['counters']['curves.cache_misses'] == 1
+    assert 'map.build' in profiling.format_report()
+
+
+def test_stage_counts_cells_and_calls(enabled):
+    for _ in range(3):
+        with profiling.stage('test.stage', cells=10) as stage:
+            stage.add_cells(5)
+    stats = profiling.report()['stages']['test.stage']
+    assert stats['calls'] == 3 and stats['cells'] == 45
+    assert stats['peak_rss_mb'] > 0
+
+
+def test_nested_allocation_peaks():
+    import numpy as np
+    profiling.reset()
+    profiling.enable(allocations=True, report_at_exit=False)
+    try:
+        with profiling.stage('outer'):
+            with profiling.stage('inner'):
+                block = np.ones(2**20)  # 8 MB
+                del block
+    finally:
+        profiling.disable()
+    stages = profiling.report()['stages']
+    assert stages['inner']['peak_alloc_mb'] >= 8
+    assert stages['outer']['peak_alloc_mb'] >= stages['inner']['peak_alloc_mb']
+    profiling.reset()
+
+
+def test_environment_variable_enables_report_at_exit(tmp_path):
+    output = tmp_path / 'profile.json'
+    env = dict(os.environ, SFC_PROFILE='1', SFC_PROFILE_OUTPUT=str(output))
+    code = "from lib import distribute; distribute.split_into_processors(1000, 7)"
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                            cwd=Path(__file__).parent.parent)
+    assert 'distribute.split_into_processors' in result.stderr
+    assert output.exists()
+
+
+def test_peak_rss_without_resource_module(monkeypatch):
+    monkeypatch.setattr(profiling, 'resource', None)
+    assert profiling.peak_rss_mb() == 0.0
+
+
+def test_imports_without_resource_module():
+    # resource is Unix-only, the library has to import without it
+    script = ("import sys; sys.modules['resource'] = None; "
+              "import lib.profiling, lib.curves, lib.distribute, lib.map.map; "
+              "print(lib.profiling.peak_rss_mb())")
+    out = subprocess.run([sys.executable, '-c', script], cwd=Path(__file__).parent.parent,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == '0.0'